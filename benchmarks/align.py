@@ -0,0 +1,55 @@
+"""Compare multi-stream alignment against resampling and joining.
+
+Builds the frames of many streams with different sample rates and times
+aligning them onto a one second grid with `sentenai.align.align` and with
+the previous approach of resampling every stream and outer joining them.
+
+Run with `PYTHONPATH=. python benchmarks/align.py [streams]`.
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from sentenai.align import align
+
+EVENTS = 200 * 1000
+
+
+def frames(n):
+    rng = np.random.RandomState(0)
+    start = pd.Timestamp('2017-01-01').value
+    out = {}
+    for i in range(n):
+        # one event every 0.1s to 2s on average, with jitter
+        step = int(1e8 * (1 + i * 19 // n))
+        ts = start + np.cumsum(rng.randint(step // 2, step * 3 // 2, EVENTS // (1 + i)))
+        out['s{}'.format(i)] = pd.DataFrame({
+            '.ts': pd.to_datetime(ts),
+            'x': rng.randn(len(ts)),
+            'y': rng.randint(0, 100, len(ts)),
+        })
+    return out
+
+
+def resample_join(fr, freq):
+    fr = {k: fr[k].set_index(keys=['.ts']).resample(freq).ffill() for k in fr}
+    for s in fr:
+        fr[s] = fr[s].rename(columns={k: s + ":" + k for k in fr[s].columns})
+    parts = list(fr.values())
+    return pd.DataFrame.join(parts[0], parts[1:], how="outer").reset_index()
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    fr = frames(n)
+    results = {}
+    for name, run in [("resample+join", resample_join), ("align", align)]:
+        t = time.time()
+        results[name] = run(fr, '1s')
+        print("{:<14} {:>8.3f}s for {} streams, {} grid points".format(
+            name, time.time() - t, n, len(results[name])))
+    a, b = results["resample+join"], results["align"]
+    pd.testing.assert_frame_equal(a[b.columns], b, check_dtype=False)
+    print("outputs match")
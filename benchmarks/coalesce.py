@@ -0,0 +1,51 @@
+"""Measure the downloads saved by coalescing overlapping windows.
+
+Serves a stream with an event every 100ms from a mock server that slices
+it by the requested range, and materializes a `dataset` whose windows
+overlap their neighbours, with and without coalescing.
+
+Run with `PYTHONPATH=. python benchmarks/coalesce.py`.
+"""
+import json
+import re
+import time
+from datetime import datetime, timedelta
+
+import requests_mock
+
+from sentenai import Sentenai, select, stream
+from sentenai.utils import cts
+
+URL = "https://api.sentenai.com/"
+SPANS = 200
+T0 = datetime(2017, 1, 1)
+
+
+STREAM = [(T0 + timedelta(milliseconds=100 * i), {
+    'stream': 'foo', 'id': str(i), 'event': {'x': i},
+    'ts': (T0 + timedelta(milliseconds=100 * i)).isoformat() + 'Z'}) for i in range(SPANS * 20 + 100)]
+
+
+def events(request, context):
+    _, start, end = request.path.split('/')[-2].split('+')
+    start, end = [cts(t.upper()).replace(tzinfo=None) for t in (start, end)]
+    return json.dumps({'streams': {'foo': 'foo'},
+                       'events': [e for t, e in STREAM if start <= t < end]})
+
+
+if __name__ == '__main__':
+    s = stream("foo")
+    spans = [{'cursor': 'q+{}'.format(i),
+              'start': (T0 + timedelta(seconds=2 * i)).isoformat() + 'Z',
+              'end': (T0 + timedelta(seconds=2 * i + 1)).isoformat() + 'Z'} for i in range(SPANS)]
+    with requests_mock.mock() as m:
+        m.post(URL + "query", headers={'location': 'q'})
+        m.get(URL + "query/q/spans", json={'spans': spans})
+        m.get(re.compile(URL + r"query/q\+.*/events"), text=events)
+        cursor = Sentenai().query(select().span(s.x == 1))
+        for coalesce in (False, True):
+            group = cursor.dataset(window=timedelta(seconds=5), coalesce=coalesce)
+            t = time.time()
+            n = sum(len(f) for f in group.dataframes())
+            print("coalesce={:<5} {:>6.2f}s {} rows, {}".format(
+                coalesce, time.time() - t, n, group.metrics))
@@ -0,0 +1,44 @@
+"""Compare decoding event pages in threads and in worker processes.
+
+Decodes the same page bodies into frames with `decode_frames` on a thread
+pool, as `dataset` does by default, and on a process pool, as it does with
+`processes`. Only processes can use more than one core.
+
+Run with `PYTHONPATH=. python benchmarks/decode.py [workers]`. The number
+of workers defaults to the number of cores.
+"""
+import json
+import multiprocessing
+import multiprocessing.pool
+import sys
+import time
+
+from sentenai.api import decode_frames
+
+PAGES = 32
+EVENTS = 2000
+
+
+def body(n):
+    return json.dumps({
+        'streams': {'foo': 'foo'},
+        'events': [{'stream': 'foo', 'id': str(i),
+                    'ts': '2017-01-01T00:00:{:02d}.{:06d}Z'.format(n % 60, i),
+                    'event': {'x': i, 'y': {'z': [1, 2, 3], 'w': 'abc'}}}
+                   for i in range(EVENTS)]}).encode('utf-8')
+
+
+def decode(content):
+    return decode_frames(content, 'application/json')
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    pages = [body(n) for n in range(PAGES)]
+    for name, pool in [("threads", multiprocessing.pool.ThreadPool(workers)),
+                       ("processes", multiprocessing.Pool(workers))]:
+        t = time.time()
+        frames = pool.map(decode, pages)
+        print("{:<10} {:>8.3f}s for {} pages of {} events, {} workers".format(
+            name, time.time() - t, PAGES, EVENTS, workers))
+        pool.terminate()
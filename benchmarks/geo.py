@@ -0,0 +1,33 @@
+"""Benchmark vectorized region tests over 10M GPS points.
+
+Run with `PYTHONPATH=. python benchmarks/geo.py`.
+"""
+import time
+
+import numpy as np
+
+from shapely.geometry import Point
+from sentenai import within_distance, inside_region
+from sentenai.geo import in_circle, in_polygon
+
+N = 10 * 1000 * 1000
+
+
+def timed(name, f, *args):
+    t = time.time()
+    r = f(*args)
+    dt = time.time() - t
+    print("{:<28} {:>8.3f}s {:>12.1f}M points/s {:>10} inside".format(
+        name, dt, N / dt / 1e6, int(r.sum())))
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(0)
+    lat = rng.uniform(41.0, 43.0, N)
+    lon = rng.uniform(-72.0, -70.0, N)
+
+    ring = Point(-71.06, 42.36).buffer(0.3, resolution=250)
+
+    timed("within_distance(10km)", in_circle, lat, lon, within_distance(10, of=Point(-71.06, 42.36)))
+    timed("inside_region(4 vertices)", in_polygon, lat, lon, inside_region(Point(-71.06, 42.36).buffer(0.3, resolution=1)))
+    timed("inside_region(1000 vertices)", in_polygon, lat, lon, inside_region(ring))
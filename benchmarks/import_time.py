@@ -0,0 +1,38 @@
+"""Measure the time to `import sentenai` in a fresh interpreter.
+
+Exits with an error when the median import time is over budget or when a
+heavy dependency is imported eagerly.
+
+Run with `PYTHONPATH=. python benchmarks/import_time.py [budget in ms]`.
+"""
+import subprocess
+import sys
+
+HEAVY = ['pandas', 'numpy', 'multiprocessing.pool', 'shapely', 'dateutil.parser']
+CODE = """
+import sys, time
+t = time.time()
+import sentenai
+print((time.time() - t) * 1000)
+print(','.join(m for m in {!r} if m in sys.modules))
+""".format(HEAVY)
+
+
+def run():
+    out = subprocess.check_output([sys.executable, '-c', CODE]).decode('utf-8')
+    ms, heavy = out.split('\n')[:2]
+    return float(ms), heavy
+
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 250.0
+    results = [run() for _ in range(9)]
+    times = sorted(ms for ms, _ in results)
+    median = times[len(times) // 2]
+    print("import sentenai: median {:.1f}ms, min {:.1f}ms, max {:.1f}ms (budget {:.0f}ms)".format(
+        median, times[0], times[-1], budget))
+    heavy = results[0][1]
+    if heavy:
+        sys.exit("heavy modules imported eagerly: " + heavy)
+    if median > budget:
+        sys.exit("import time over budget")
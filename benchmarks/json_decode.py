@@ -0,0 +1,52 @@
+"""Measure decode throughput of event pages for each JSON backend.
+
+Pages are shaped like the responses of `/query/<cursor>/events`.
+
+Run with `PYTHONPATH=. python benchmarks/json_decode.py`.
+"""
+import json
+import random
+import time
+
+from sentenai.codec import BACKENDS, JSONCodec
+from sentenai.exceptions import SentenaiException
+
+EVENTS = 1000
+PAGES = 200
+
+
+def page(rng):
+    return {
+        'streams': {'weather': {'name': 'weather'}, 'traffic': {'name': 'traffic'}},
+        'events': [{
+            'stream': rng.choice(['weather', 'traffic']),
+            'id': '{:032x}'.format(rng.getrandbits(128)),
+            'ts': '2017-01-01T00:{:02d}:{:02d}.{:03d}Z'.format(i // 60 % 60, i % 60, i % 1000),
+            'event': {
+                'temperature': rng.uniform(-20, 40),
+                'humidity': rng.random(),
+                'station': {'id': rng.randint(0, 10000), 'name': 'station-{}'.format(i % 97)},
+                'ok': rng.random() > 0.1,
+                'tags': ['a', 'b', 'c'][:rng.randint(0, 3)],
+            },
+        } for i in range(EVENTS)],
+    }
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    pages = [json.dumps(page(rng)).encode('utf-8') for _ in range(PAGES)]
+    size = sum(len(p) for p in pages)
+
+    for backend in BACKENDS:
+        try:
+            codec = JSONCodec(backend)
+        except SentenaiException:
+            print("{:<8} not installed".format(backend))
+            continue
+        t = time.time()
+        for p in pages:
+            codec.decode(p)
+        dt = time.time() - t
+        print("{:<8} {:>7.1f} MB/s {:>10.0f} events/s".format(
+            backend, size / dt / 1e6, PAGES * EVENTS / dt))
@@ -0,0 +1,35 @@
+"""Measure the memory footprint of query nodes.
+
+Builds 100k of each node type and reports the bytes retained per node,
+as an `any_of` over many device ids would.
+
+Run with `PYTHONPATH=. python benchmarks/memory.py`.
+"""
+import gc
+import tracemalloc
+
+from sentenai import V, stream, delta
+from sentenai.flare import Cond
+
+N = 100 * 1000
+
+
+def footprint(name, build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = [build(i) for i in range(N)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # don't count the list holding the nodes
+    size = (after - before - 8 * len(nodes)) / float(N)
+    print("{:<12} {:>8.1f} bytes/node".format(name, size))
+    return nodes
+
+
+if __name__ == '__main__':
+    s = stream("devices")
+    footprint("EventPath", lambda i: V.device)
+    footprint("StreamPath", lambda i: s.device)
+    footprint("Cond", lambda i: Cond(V.device, '==', i))
+    footprint("Delta", lambda i: delta(seconds=i))
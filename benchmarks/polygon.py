@@ -0,0 +1,44 @@
+"""Measure the effect of simplifying `inside_region` polygons.
+
+Reports the size of the query AST and the time to evaluate the region
+locally over 1M points for a 20k vertex boundary at several tolerances.
+
+Run with `PYTHONPATH=. python benchmarks/polygon.py`.
+"""
+import json
+import time
+
+import numpy as np
+
+from shapely.geometry import Polygon
+from sentenai import stream, select, inside_region
+from sentenai.flare import ast_dict
+from sentenai.geo import in_polygon
+
+N = 1000 * 1000
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(0)
+    lat = rng.uniform(41.0, 43.0, N)
+    lon = rng.uniform(-72.0, -70.0, N)
+    s = stream("gps")
+
+    # a wiggly boundary with 20k vertices
+    a = np.linspace(0, 2 * np.pi, 20000, endpoint=False)
+    r = 0.5 + 0.01 * np.sin(a * 200)
+    boundary = Polygon(
+        list(zip(-71.06 + r * np.cos(a), 42.36 + r * np.sin(a))))
+
+    base = None
+    for tolerance in (None, 0.0001, 0.001, 0.01):
+        region = inside_region(boundary, tolerance=tolerance)
+        body = json.dumps(ast_dict(select().span(s.loc == region)))
+        t = time.time()
+        inside = in_polygon(lat, lon, region).sum()
+        dt = time.time() - t
+        base = base or (len(body), dt)
+        print("tolerance={:<8} vertices={:>6} payload={:>9}B ({:>5.1f}%) "
+              "eval={:.3f}s ({:>5.1f}%) inside={}".format(
+                  str(tolerance), len(region.poly.exterior.coords), len(body),
+                  100.0 * len(body) / base[0], dt, 100.0 * dt / base[1], inside))
@@ -0,0 +1,93 @@
+"""Measure the effect of page prefetching on slicing a long span.
+
+Serves a slice of many event pages from a local HTTP server in another
+process, with a simulated network latency, and times `Cursor._slice` with
+pages prefetched in the background and fetched one after another.
+
+Run with `PYTHONPATH=. python benchmarks/prefetch.py [latency in seconds]`.
+The latency defaults to the time it takes to decode a page.
+"""
+import json
+import multiprocessing
+import sys
+import time
+from datetime import datetime
+
+import requests_mock
+
+import sentenai.api
+from sentenai import Sentenai
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+PAGES = 40
+EVENTS = 2000
+
+
+class Inline(object):
+    """Run a function immediately, as without prefetching."""
+
+    def __init__(self, func, *args):
+        self.result = func(*args)
+
+    def get(self):
+        return self.result
+
+
+def body():
+    return json.dumps({
+        'streams': {'foo': 'foo'},
+        'events': [{'stream': 'foo', 'id': str(i), 'ts': '2017-01-01T00:00:00Z',
+                    'event': {'x': i, 'y': {'z': [1, 2, 3], 'w': 'abc'}}}
+                   for i in range(EVENTS)]}).encode('utf-8')
+
+
+def serve(port, latency):
+    page = body()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            tail = self.path.rsplit('/', 2)[-2].split('+')[-1]
+            n = int(tail) if tail.isdigit() else 0
+            self.send_response(200)
+            if n + 1 < PAGES:
+                self.send_header('cursor', 'q+{}'.format(n + 1))
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args):
+            pass
+
+    HTTPServer(('127.0.0.1', port), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    client = Sentenai()
+    t = time.time()
+    client.json.decode(body())
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else time.time() - t
+
+    server = multiprocessing.Process(target=serve, args=(8765, latency))
+    server.daemon = True
+    server.start()
+    time.sleep(0.5)
+
+    client = Sentenai(host="http://127.0.0.1:8765")
+    with requests_mock.mock(real_http=True) as m:
+        m.post("http://127.0.0.1:8765/query", headers={'location': 'q'})
+        cursor = client.query()
+    for name, runner in [("sequential", Inline), ("prefetch", sentenai.api.Background)]:
+        sentenai.api.Background = runner
+        t = time.time()
+        cursor._slice("q", datetime(2017, 1, 1), datetime(2017, 1, 1))
+        print("{:<12} {:>8.3f}s for {} pages, {:.1f}ms latency".format(
+            name, time.time() - t, PAGES, latency * 1000))
+    server.terminate()
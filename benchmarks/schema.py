@@ -0,0 +1,39 @@
+"""Report the memory saved by compact dtypes on a frame of events.
+
+Builds a frame of events with `df` as a query slice would, then compacts
+it with and without downcasting and prints the per-column savings.
+
+Run with `PYTHONPATH=. python benchmarks/schema.py`.
+"""
+import random
+import time
+
+import pandas as pd
+
+from sentenai.api import df
+from sentenai.schema import compact, savings
+
+EVENTS = 200 * 1000
+
+
+def slice_data():
+    rng = random.Random(0)
+    return {'streams': [{'stream': 'foo', 'events': [
+        {'id': str(i), 'ts': '2017-01-01T00:00:00Z', 'event': {
+            'temp': rng.gauss(20, 5),
+            'count': rng.randint(0, 1000),
+            'state': rng.choice(['idle', 'running', 'stopped', 'error']),
+            'site': {'name': rng.choice(['boston', 'denver', 'austin'])},
+        }} for i in range(EVENTS)]}]}
+
+
+if __name__ == '__main__':
+    pd.set_option('display.width', 120)
+    frame = df(None, slice_data())['foo']
+    schema = {'temp': 'float64', 'count': 'float64', 'state': 'category', 'site.name': 'category'}
+    for name, kwargs in [("compact", {}), ("compact+downcast", {'downcast': True})]:
+        t = time.time()
+        out = compact(frame, schema, **kwargs)
+        print("{} ({:.3f}s)".format(name, time.time() - t))
+        print(savings(frame, out).to_string())
+        print("")
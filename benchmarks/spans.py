@@ -0,0 +1,74 @@
+"""Compare span storage and statistics against lists of span dicts.
+
+Builds 1M spans and reports the memory retained and the time taken by
+`stats()` for the array backed `Spans` and for the previous list of dicts,
+then times the span set algebra.
+
+Run with `PYTHONPATH=. python benchmarks/spans.py`.
+"""
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from sentenai.spans import Spans
+from sentenai.utils import DTMIN
+
+N = 1000 * 1000
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, (after - before) / float(N)
+
+
+def dict_stats(spans):
+    deltas = [sp['end'] - sp['start'] for sp in spans if sp.get('start') and sp.get('end')]
+    mean = sum([3600*24*d.days + d.seconds for d in deltas]) / float(len(deltas))
+    return {
+        'min': min(deltas),
+        'max': max(deltas),
+        'mean': timedelta(seconds=mean),
+        'median': sorted(deltas)[len(deltas)//2],
+        'count': len(deltas),
+    }
+
+
+if __name__ == '__main__':
+    t0 = datetime(2017, 1, 1, tzinfo=DTMIN.tzinfo)
+    offsets = np.cumsum(np.random.randint(1, 600, 2 * N)).tolist()
+    cursor = "q+2017-01-01T00:00:00Z+2018-01-01T00:00:00Z"
+
+    dicts, dsize = measure(lambda: [
+        {'cursor': cursor,
+         'start': t0 + timedelta(seconds=offsets[2 * i]),
+         'end': t0 + timedelta(seconds=offsets[2 * i + 1])}
+        for i in range(N)])
+    spans, ssize = measure(lambda: Spans.parse(dicts))
+
+    t = time.time()
+    dict_stats(dicts)
+    dt = time.time() - t
+    t = time.time()
+    spans.stats()
+    st = time.time() - t
+
+    print("{:<8} {:>8.1f} bytes/span {:>8.3f}s stats".format("dicts", dsize, dt))
+    print("{:<8} {:>8.1f} bytes/span {:>8.3f}s stats".format("Spans", ssize, st))
+
+    other = Spans(spans.starts + 300 * 10**9, spans.ends + 300 * 10**9)
+    for name, op in [
+            ("complement", lambda: spans.complement()),
+            ("union", lambda: spans.union(other)),
+            ("intersection", lambda: spans.intersection(other)),
+            ("merge", lambda: spans.merge(timedelta(minutes=5)))]:
+        t = time.time()
+        op()
+        print("{:<12} {:>8.3f}s".format(name, time.time() - t))
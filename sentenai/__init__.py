@@ -1,8 +1,8 @@
 import json
 
 from sentenai.flare import (
-    delta, stream, EventPath, FlareSyntaxError, InCircle, InPolygon, Par,
-    Select, Span, Switch, merge, project, ast
+    delta, stream, Cond, EventPath, FlareSyntaxError, InCircle, InPolygon,
+    Par, Select, Span, Switch, merge, project, ast
 )
 from sentenai.api import Sentenai
 from sentenai.utils import LEFT, RIGHT, CENTER, PY3
@@ -11,7 +11,7 @@ from sentenai.utils import LEFT, RIGHT, CENTER, PY3
 __all__ = [
     'FlareSyntaxError', 'LEFT', 'CENTER', 'RIGHT', 'Sentenai', 'span',
     'any_of', 'all_of', 'V', 'delta', 'event', 'stream', 'select',
-    'ast', 'within_distance', 'inside_region', 'merge'
+    'ast', 'within_distance', 'inside_region', 'merge', 'isin', 'between'
 ]
 
 # Python 2 Compatibility Decorator
@@ -61,11 +61,45 @@ def all_of(*q):
     return Par("all", q)
 
 
+def isin(path, values):
+    """Return events where a path has one of many values.
+
+    The values are encoded as a single sorted list of unique values, which
+    is much more compact than `any_of` over one condition per value.
+
+    Arguments:
+    path -- an event path like `V.device` or a stream path.
+    values -- a list, set, numpy array or other iterable of values.
+    """
+    values = values.tolist() if hasattr(values, 'tolist') else list(values)
+    values = [v.item() if hasattr(v, 'item') else v for v in values]
+    try:
+        values = sorted(set(values))
+    except TypeError:
+        values = list(dict.fromkeys(values))
+    return Cond(path, 'in', values)
+
+
+def between(path, low, high):
+    """Return events where a path is in the closed range `[low, high]`."""
+    low = low.item() if hasattr(low, 'item') else low
+    high = high.item() if hasattr(high, 'item') else high
+    return all_of(path >= low, path <= high)
+
+
 def within_distance(km, of):
     """Return all events within a given distance (in km) from a point."""
     return InCircle(of, km)
 
 
-def inside_region(poly):
-    """Return all events within a polygon."""
-    return InPolygon(poly)
+def inside_region(poly, tolerance=None, prefilter=True):
+    """Return all events within a polygon.
+
+    Arguments:
+    poly -- a `shapely.geometry.Polygon`.
+    tolerance -- simplify the polygon to within this distance of the
+                 original boundary before sending it. (optional)
+    prefilter -- also test the bounding box of the polygon, so most events
+                 can be rejected without the polygon test. (default True)
+    """
+    return InPolygon(poly, tolerance, prefilter)
@@ -0,0 +1,236 @@
+from sentenai.exceptions import SentenaiException
+from sentenai.utils import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+
+METHODS = ('ffill', 'nearest')
+
+
+def grid(frames, freq):
+    """Build the target time grid of a set of frames.
+
+    The grid has the bin labels `resample(freq)` would give, from the bin
+    of the earliest event of any frame to the bin of the latest one.
+
+    Arguments:
+        frames -- a dictionary of event frames with a `.ts` column.
+        freq   -- a pandas frequency string or offset.
+    """
+    firsts = [f['.ts'].min() for f in frames.values()]
+    lasts = [f['.ts'].max() for f in frames.values()]
+    bounds = pd.DatetimeIndex([min(firsts), max(lasts)])
+    return pd.Series(0, index=bounds).resample(freq).asfreq().index
+
+
+def positions(ts, target, method='ffill', tolerance=None):
+    """Find the event to place at each point of a target grid.
+
+    Arguments:
+        ts        -- sorted event times in epoch nanoseconds.
+        target    -- grid times in epoch nanoseconds.
+        method    -- `ffill` takes the last event at or before each grid
+                     point, `nearest` the closest event on either side.
+        tolerance -- the furthest an event may be from its grid point, in
+                     nanoseconds.
+
+    Returns:
+        (idx, valid) -- the index of the event for each grid point, and
+                        whether there is one.
+    """
+    right = np.searchsorted(ts, target, 'right')
+    idx = right - 1
+    if method == 'nearest' and len(ts):
+        after = np.minimum(right, len(ts) - 1)
+        before = np.maximum(idx, 0)
+        closer = (np.abs(ts[after] - target) < np.abs(target - ts[before])) | (idx < 0)
+        idx = np.where(closer, after, idx)
+    elif method not in METHODS:
+        raise SentenaiException("Unknown alignment method: {}".format(method))
+    valid = idx >= 0
+    safe = np.maximum(idx, 0)
+    if tolerance is not None and len(ts):
+        valid &= np.abs(target - ts[safe]) <= tolerance
+    return safe, valid
+
+
+def align(frames, freq, method='ffill', tolerance=None):
+    """Align the events of several streams onto one time grid.
+
+    Every stream is placed onto the grid in a single pass, by searching
+    the grid times among its sorted event times, and the aligned columns
+    are concatenated once. This replaces resampling each stream and
+    outer joining the results, which copies every frame once per stream.
+
+    Arguments:
+        frames    -- a dictionary mapping stream names to frames of events
+                     with a `.ts` column, as returned by `df`.
+        freq      -- the frequency of the grid.
+        method    -- `ffill` or `nearest`. Forward filled streams end at
+                     their last event.
+        tolerance -- the furthest an event may be from a grid point, as a
+                     timedelta or pandas offset string. Grid points with no
+                     event within the tolerance are left empty.
+
+    Returns:
+        frame -- a frame with a `.ts` column of grid times and a
+                 `stream:column` column per stream column.
+    """
+    if not frames:
+        return pd.DataFrame()
+    target = grid(frames, freq)
+    tol = None if tolerance is None else pd.Timedelta(tolerance).value
+    tt = target.asi8
+    parts = [pd.DataFrame({'.ts': target})]
+    for name, frame in frames.items():
+        ts = pd.DatetimeIndex(frame['.ts']).asi8
+        order = np.argsort(ts, kind='mergesort')
+        idx, valid = positions(ts[order], tt, method, tol)
+        if method == 'ffill' and len(ts):
+            # like resampling, a stream isn't carried past its last event
+            valid &= tt <= ts[order[-1]]
+        taken = frame.drop('.ts', axis=1).iloc[order[idx]].reset_index(drop=True)
+        if not valid.all():
+            taken = taken.where(np.repeat(valid[:, None], taken.shape[1], axis=1))
+        taken.columns = [name + ":" + c for c in taken.columns]
+        parts.append(taken)
+    return pd.concat(parts, axis=1)
+
+
+AGGREGATES = ('mean', 'min', 'max', 'last', 'count', 'sum')
+
+# the partial results each aggregate is built from, and how partial results
+# of the same bucket are merged
+PARTIALS = {
+    'mean': ('sum', 'count'),
+    'min': ('min',),
+    'max': ('max',),
+    'last': ('last',),
+    'count': ('count',),
+    'sum': ('sum',),
+}
+MERGE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max', 'last': 'last'}
+
+
+class Resampler(object):
+    """Aggregate the events of several streams into buckets of time.
+
+    Events are added a frame at a time, for instance one frame per page
+    of a slice. Each frame is reduced to per bucket partial results (sums,
+    counts, minima, maxima and last values) in one vectorized group by, so
+    only these accumulators are kept in memory rather than the events.
+    Buckets are `freq` long and start at multiples of `freq` since the
+    epoch.
+    """
+
+    def __init__(self, freq, how='last', compact=64):
+        """Initialize the resampler.
+
+        Arguments:
+            freq    -- the length of a bucket, as a fixed pandas frequency.
+            how     -- the aggregate of each column: one of `mean`, `min`,
+                       `max`, `last`, `count` and `sum`, or a dictionary
+                       mapping `stream:column` or `column` names to one.
+                       A single aggregate applies to numeric columns only.
+                       Columns with no aggregate take their last value.
+            compact -- merge the partial results of a stream once this many
+                       frames have been added.
+        """
+        for agg in (how.values() if isinstance(how, dict) else [how]):
+            if agg not in AGGREGATES:
+                raise SentenaiException("Unknown aggregate: {}".format(agg))
+        self.freq = freq
+        self.how = how
+        self.compact = compact
+        self.columns = {}
+        self.partials = {}
+
+    def aggregate(self, stream, column, numeric):
+        """Get the aggregate of a column of a stream."""
+        if isinstance(self.how, dict):
+            key = stream + ":" + column
+            return self.how.get(key, self.how.get(column, 'last'))
+        return self.how if numeric else 'last'
+
+    def add(self, frames):
+        """Add a dictionary of event frames with a `.ts` column."""
+        for name, frame in frames.items():
+            if frame.empty:
+                continue
+            buckets = pd.DatetimeIndex(frame['.ts']).floor(self.freq)
+            values = frame.drop('.ts', axis=1)
+            columns = self.columns.setdefault(name, {})
+            spec = {}
+            for c in values.columns:
+                if c not in columns:
+                    numeric = pd.api.types.is_numeric_dtype(values[c])
+                    columns[c] = self.aggregate(name, c, numeric)
+                spec[c] = list(PARTIALS[columns[c]])
+            part = values.groupby(buckets, sort=True).agg(spec)
+            part.columns = [c + "\0" + p for c, p in part.columns]
+            parts = self.partials.setdefault(name, [])
+            parts.append(part)
+            if len(parts) >= self.compact:
+                self.partials[name] = [self.merge(parts)]
+        return self
+
+    def merge(self, parts):
+        """Merge the partial results of buckets split across frames."""
+        part = pd.concat(parts)
+        if part.index.is_unique:
+            return part.sort_index()
+        return part.groupby(level=0, sort=True).agg(
+            {k: MERGE[k.rsplit("\0", 1)[1]] for k in part.columns})
+
+    def merged(self):
+        """Merge the partial results of every stream."""
+        for k, v in self.partials.items():
+            if len(v) > 1 or (v and not v[0].index.is_monotonic_increasing):
+                self.partials[k] = [self.merge(v)]
+        return {k: v[0] for k, v in self.partials.items() if v}
+
+    def bounds(self):
+        """Get the first and last bucket of every stream with events."""
+        return {k: (v.index[0], v.index[-1]) for k, v in self.merged().items()}
+
+    def frame(self):
+        """Get the aggregated frame.
+
+        Returns:
+            frame -- a frame with a `.ts` column of bucket start times over
+                     the range of every stream, and a `stream:column`
+                     column per stream column. Empty buckets have a count
+                     of zero and no other values.
+        """
+        merged = self.merged()
+        if not merged:
+            return pd.DataFrame()
+        lo = min(p.index[0] for p in merged.values())
+        hi = max(p.index[-1] for p in merged.values())
+        target = pd.date_range(lo, hi, freq=self.freq)
+        parts = [pd.DataFrame({'.ts': target})]
+        for name, part in merged.items():
+            part = part.reindex(target)
+            out = {}
+            for c, agg in self.columns[name].items():
+                if agg == 'mean':
+                    out[name + ":" + c] = part[c + "\0sum"] / part[c + "\0count"]
+                elif agg == 'count':
+                    out[name + ":" + c] = part[c + "\0count"].fillna(0).astype('int64')
+                else:
+                    out[name + ":" + c] = part[c + "\0" + agg]
+            parts.append(pd.DataFrame(out).reset_index(drop=True))
+        return pd.concat(parts, axis=1)
+
+
+def aggregate(frames, freq, how='last'):
+    """Aggregate the events of several streams into buckets of time.
+
+    Arguments:
+        frames -- a dictionary mapping stream names to frames of events
+                  with a `.ts` column, as returned by `df`.
+        freq   -- the length of a bucket.
+        how    -- the aggregate of each column, see `Resampler`.
+    """
+    return Resampler(freq, how).add(frames).frame()
@@ -1,19 +1,25 @@
-import json
+import atexit
+import copy
+import io
 import re
 import requests
+import threading
 
-import numpy as np
-import pandas as pd
-
-from pandas.io.json import json_normalize
+from collections import deque
 from datetime import timedelta
-from multiprocessing.pool import ThreadPool
 from functools import partial
+from itertools import islice
 
 from sentenai.exceptions import *
 from sentenai.exceptions import handle
+from sentenai.align import Resampler, aggregate, align as align_frames, grid as time_grid
+from sentenai.checkpoint import Checkpoint, query_key
+from sentenai.codec import JSONCodec, codec as get_codec, gzipped
+from sentenai.retry import RetrySession
+from sentenai.schema import compact as compact_frame, concat as concat_frames, field_name
+from sentenai.spans import OPEN, SINCE, Spans
 from sentenai.utils import *
-from sentenai.flare import EventPath, Stream, stream, project, ast_dict, delta, Delta, Select
+from sentenai.flare import EventPath, Stream, stream, project, projection, ast_dict, delta, Delta, Select
 
 if not PY3:
     import virtualtime
@@ -26,51 +32,62 @@ try:
 except:
     from urllib import quote
 
+# Membership lists longer than this are split into concurrent queries.
+CHUNK_SIZE = 10000
+
+mp = LazyModule('multiprocessing.pool')
+multiprocessing = LazyModule('multiprocessing')
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
 
 
 class Uploader(object):
-    def __init__(self, client, iterator, processes=32):
+    def __init__(self, client, iterator, processes=None):
+        """Initialize the uploader.
+
+        Arguments:
+            client    -- a Sentenai client.
+            iterator  -- an iterator of event dictionaries.
+            processes -- the number of upload threads. Defaults to the
+                         maximum of the client's `AdaptiveLimit`, which
+                         governs how many uploads are actually in flight.
+        """
         self.client = client
         self.iterator = iterator
-        self.pool = ThreadPool(processes)
+        self.pool = mp.ThreadPool(processes or client.session.limit.maximum)
 
     def process(self, data):
-        def waits():
-            yield 0
-            wl = (0,1)
-            while True:
-                wl = (wl[-1], sum(wl))
-                yield wl[-1]
+        """Upload an event.
+
+        Failed requests are retried by the client's `RetryPolicy`.
 
+        Returns:
+            None if the event was saved, or a `(data, reason)` tuple.
+        """
         event = self.validate(data)
-        if isinstance(tuple, event):
+        if isinstance(event, tuple):
             return event
 
-        wait = waits()
-        while event:
-            try:
-                self.client.put(**event)
-            except AuthenticationError:
-                raise
-            except APIError as e:
-                if e.response.status_code == 400:
-                    # probably bad JSON
-                    return data
-                else:
-                    time.sleep(next(wait))
-            else:
-                return
+        try:
+            self.client.put(**event)
+        except AuthenticationError:
+            raise
+        except FlareSyntaxError:
+            # probably bad JSON
+            return (data, "invalid event data")
+        except SentenaiException as e:
+            return (data, str(e) or e.__class__.__name__)
 
     def start(self):
-        data = self.pool.map(process, self.iterator)
-        return { 'saved': len(data), 'failed': filter(data) }
+        data = self.pool.map(self.process, self.iterator)
+        failed = [d for d in data if d]
+        return {'saved': len(data) - len(failed), 'failed': failed}
 
 
     def validate(self, data):
         ts = data.get('ts')
         try:
-            if not ts.tzinfo:
-                ts = pytz.localize(ts)
+            ts = utc(ts)
         except:
             return (data, "invalid timestamp")
 
@@ -84,23 +101,45 @@ class Uploader(object):
         except Exception:
             return (data, "invalid event data")
         else:
-            return {"stream": stream(sid), "timestamp": ts, "id": sid}
+            return {"stream": stream(sid), "event": evt, "timestamp": ts, "id": sid}
 
 
 class Sentenai(object):
-    def __init__(self, auth_key="", host="https://api.sentenai.com"):
+    def __init__(self, auth_key="", host="https://api.sentenai.com", codec="json", compress=False, json_backend=None, retry=None, concurrency=None, rate_limit=None):
         """Initialize a Sentenai client.
 
         The client object handles all requests to the Sentenai API.
 
         Arguments:
             auth_key -- a Sentenai API auth key
+            codec    -- the wire encoding of queries and results: `json`,
+                        `msgpack` or a `sentenai.codec.Codec` instance.
+            compress -- gzip request bodies.
+            json_backend -- the JSON library to use, `orjson`, `ujson` or
+                        `json`. Defaults to the fastest one installed.
+            retry    -- the `RetryPolicy` of every request. Share a policy
+                        between clients to share its circuit breakers.
+            concurrency -- the `AdaptiveLimit` on requests in flight, which
+                        grows while the server keeps up and backs off when
+                        it throttles or fails.
+            rate_limit -- a `RateLimiter` on requests and bytes per second.
+                        Attach the same limiter to several clients to keep
+                        their combined traffic under the server's limits.
         """
         self.auth_key = auth_key
         self.host = host
         self.build_url = partial(build_url, self.host)
-        self.session = requests.Session()
+        self.json = JSONCodec(json_backend)
+        self.codec = self.json if codec == "json" else get_codec(codec)
+        self.compress = compress
+        self.session = RetrySession(retry, concurrency, rate_limit)
+        self._schemas = {}
+        self._schema_lock = threading.Lock()
+        self._procs = {}
+        self._procs_lock = threading.Lock()
         self.session.headers.update({ 'auth-key': auth_key })
+        if not isinstance(self.codec, JSONCodec):
+            self.session.headers['accept'] = self.codec.content_type + ', application/json'
 
     def __str__(self):
         """Return a string representation of the object."""
@@ -111,6 +150,29 @@ class Sentenai(object):
         return "Sentenai(auth_key='{}', server='{}')".format(
             self.auth_key, self.host)
 
+    def encode(self, obj):
+        """Encode a request body with the client's codec.
+
+        Returns:
+            (body, headers) -- the encoded body and its content headers.
+        """
+        body = self.codec.encode(obj)
+        headers = {'content-type': self.codec.content_type}
+        if self.compress:
+            body = gzipped(body)
+            headers['content-encoding'] = 'gzip'
+        return body, headers
+
+    def decode(self, resp):
+        """Decode a response body according to its content type."""
+        ctype = resp.headers.get('content-type', '')
+        if self.codec.content_type in ctype:
+            return self.codec.decode(resp.content)
+        elif 'msgpack' in ctype:
+            return get_codec('msgpack').decode(resp.content)
+        else:
+            return self.json.decode(resp.content)
+
     def debug(self, protocol="http", host="localhost", port=3000):
         self.host = protocol + "://" + host + ":" + str(port)
         return self
@@ -160,9 +222,9 @@ class Sentenai(object):
             return {
                 'id': resp.headers['location'],
                 'ts': resp.headers['timestamp'],
-                'event': resp.json()}
+                'event': self.decode(resp)}
         else:
-            return resp.json()
+            return self.decode(resp)
 
     def stats(self, stream, field, start=None, end=None):
         """Get stats for a given field in a stream.
@@ -186,7 +248,7 @@ class Sentenai(object):
         else:
             status_codes(resp)
 
-        return resp.json()
+        return self.decode(resp)
 
     def put(self, stream, event, id=None, timestamp=None):
         """Put a new event into a stream.
@@ -201,10 +263,7 @@ class Sentenai(object):
            timestamp -- A user-specified datetime object representing the
                         time of the event. (optional)
         """
-        headers = {
-            'content-type': 'application/json'
-        }
-        jd = event
+        body, headers = self.encode(event)
 
         if timestamp:
             headers['timestamp'] = iso8601(timestamp)
@@ -213,7 +272,7 @@ class Sentenai(object):
             url = '{host}/streams/{sid}/events/{eid}'.format(
                 sid=stream()['name'], host=self.host, eid=id
             )
-            resp = self.session.put(url, json=jd, headers=headers)
+            resp = self.session.put(url, data=body, headers=headers)
             if resp.status_code not in [200, 201]:
                 status_codes(resp)
             else:
@@ -222,7 +281,7 @@ class Sentenai(object):
             url = '{host}/streams/{sid}/events'.format(
                 sid=stream._name, host=self.host
             )
-            resp = self.session.post(url, json=jd, headers=headers)
+            resp = self.session.post(url, data=body, headers=headers)
             if resp.status_code in [200, 201]:
                 return resp.headers['location']
             else:
@@ -253,7 +312,7 @@ class Sentenai(object):
             return f
 
         try:
-            return [stream(**v) for v in resp.json() if filtered(v)]
+            return [stream(**v) for v in self.decode(resp) if filtered(v)]
         except:
             raise SentenaiException("Something went wrong")
 
@@ -265,8 +324,7 @@ class Sentenai(object):
                      in Sentenai.
         """
         url = "/".join([self.host, "streams", stream()['name']])
-        headers = {'auth-key': self.auth_key}
-        resp = requests.delete(url, headers=headers)
+        resp = self.session.delete(url)
         status_codes(resp)
         return None
 
@@ -294,14 +352,34 @@ class Sentenai(object):
         )
         resp = self.session.get(url)
         status_codes(resp)
-        return [json.loads(line) for line in resp.text.splitlines()]
+        return [self.json.decode(line) for line in resp.content.splitlines() if line]
 
-    def query(self, query=None, returning=None):
+    def query(self, query=None, returning=None, limit=None, offset=None,
+              shards=None, chunk_size=CHUNK_SIZE, checkpoint=None):
         """Execute a flare query.
 
         Arguments:
            query     -- A query object created via the `select` function.
            limit     -- A limit to the number of result spans returned.
+                        Spans are only paged in until the limit is reached,
+                        so a small limit returns the first results quickly.
+           offset    -- The number of leading result spans to skip.
+           shards    -- Optionally split the `select(start, end)` range of
+                        the query into this many time shards which are
+                        executed concurrently. Spans that cross a shard
+                        boundary are stitched back together. Duration
+                        constraints, serial patterns and switches can't
+                        be sharded.
+           checkpoint -- A path or `Checkpoint` to record the progress of
+                        the query in. A query which was already checkpointed
+                        resumes from where it stopped, without being
+                        resubmitted or downloading its spans and completed
+                        slices again.
+           chunk_size -- Membership conditions (`V.x == [...]` or `isin`)
+                        with more values than this are split into chunks
+                        which are executed as concurrent queries, and their
+                        spans are merged. Only applies to queries without
+                        sequences or duration constraints.
            returning -- An optional dictionary object mapping streams to
                         projections. Each projection is a JSON-serializable
                         dictionary where each value is either a literal
@@ -323,7 +401,16 @@ class Sentenai(object):
         """
         if isinstance(returning, Stream):
             returning = {returning: True}
-        return Cursor(self, query or Select(), returning)
+        query = query or Select()
+        if checkpoint is not None and not isinstance(checkpoint, Checkpoint):
+            checkpoint = Checkpoint(checkpoint, self.json)
+        if shards and shards > 1:
+            return ShardedCursor(self, query, returning, limit, offset, shards=shards, checkpoint=checkpoint)
+        if chunk_size:
+            chunks = chunk_ast(query(), chunk_size)
+            if len(chunks) > 1:
+                return ChunkedCursor(self, query, chunks, returning, limit, offset, checkpoint)
+        return Cursor(self, query, returning, limit, offset, checkpoint)
 
 
     def fields(self, stream):
@@ -336,10 +423,57 @@ class Sentenai(object):
         if isinstance(stream, Stream):
             url = "/".join([self.host, "streams", stream['name'], "fields"])
             resp = self.session.get(url)
-            return resp.json()
+            return self.decode(resp)
         else:
             raise SentenaiException("Must be called on stream")
 
+    def schema(self, stream, refresh=False):
+        """Get the column dtypes of the events of a stream.
+
+        Fields with numeric statistics are `float64` and all others are
+        `category`. Schemas are cached per stream. A stream whose fields or
+        statistics can't be fetched has an empty schema, which isn't cached.
+
+        Arguments:
+           stream  -- A stream object corresponding to a stream stored
+                      in Sentenai.
+           refresh -- Fetch the schema again.
+        """
+        name = stream()['name']
+        with self._schema_lock:
+            return self._schema(stream, name, refresh)
+
+    def _schema(self, stream, name, refresh):
+        if refresh or name not in self._schemas:
+            dtypes = {}
+            try:
+                for field in self.fields(stream):
+                    path = field_name(field)
+                    try:
+                        self.stats(stream, path)
+                        dtypes[path] = 'float64'
+                    except (NotFound, FlareSyntaxError):
+                        dtypes[path] = 'category'
+            except (SentenaiException, requests.RequestException, ValueError, TypeError):
+                return {}
+            self._schemas[name] = dtypes
+        return self._schemas[name]
+
+    def _process_pool(self, processes):
+        """Get the pool of `processes` worker processes for decoding pages.
+
+        Pools are started once per client, reused, and terminated at exit.
+        On Python 3 workers are spawned rather than forked, as forking while
+        download threads run can copy locks those threads hold into the
+        workers.
+        """
+        with self._procs_lock:
+            if processes not in self._procs:
+                context = multiprocessing.get_context('spawn') if PY3 else multiprocessing
+                self._procs[processes] = context.Pool(processes)
+                atexit.register(self._procs[processes].terminate)
+            return self._procs[processes]
+
     def values(self, stream):
         """Get all the latest values for a given stream.
 
@@ -354,7 +488,7 @@ class Sentenai(object):
         if isinstance(stream, Stream):
             url = "/".join([self.host, "streams", stream['name'], "values"])
             resp = self.session.get(url)
-            return resp.json()
+            return self.decode(resp)
         else:
             raise SentenaiException("Must be called on stream")
 
@@ -369,7 +503,7 @@ class Sentenai(object):
             url = "/".join([self.host, "streams", stream['name'], "newest"])
             resp = self.session.get(url)
             return {
-                    "event": resp.json(),
+                    "event": self.decode(resp),
                     "ts": cts(resp.headers['Timestamp']),
                     "id": resp.headers['Location']
             }
@@ -388,7 +522,7 @@ class Sentenai(object):
             url = "/".join([self.host, "streams", stream['name'], "oldest"])
             resp = self.session.get(url)
             return {
-                    "event": resp.json(),
+                    "event": self.decode(resp),
                     "ts": cts(resp.headers['Timestamp']),
                     "id": resp.headers['Location']
             }
@@ -397,17 +531,27 @@ class Sentenai(object):
 
 
 class Cursor(object):
-    def __init__(self, client, query, returning=None, limit=None):
+    def __init__(self, client, query, returning=None, limit=None, offset=None, checkpoint=None):
         self.client = client
         self.query = query
         self.returning = returning
         self._limit = limit
+        self._offset = offset or 0
         self.headers = {'content-type': 'application/json', 'auth-key': client.auth_key}
 
-        url = '{0}/query'.format(client.host)
-
-        r = handle(requests.post(url, json=ast_dict(query, returning), headers=self.headers))
-        self.query_id = r.headers['location']
+        tree = ast_dict(query, returning)
+        self._checkpoint = checkpoint
+        self._key = query_key(tree) if checkpoint else None
+        if checkpoint and checkpoint.state(self._key)['query_id']:
+            self.query_id = checkpoint.state(self._key)['query_id']
+        else:
+            url = '{0}/query'.format(client.host)
+            body, headers = client.encode(tree)
+            headers['auth-key'] = client.auth_key
+            r = handle(client.session.post(url, data=body, headers=headers))
+            self.query_id = r.headers['location']
+            if checkpoint:
+                checkpoint.query_id(self._key, self.query_id)
         self._pool = None
 
 
@@ -416,60 +560,157 @@ class Cursor(object):
 
     @property
     def pool(self):
+        """A thread pool for fetching slices.
+
+        The pool has a thread per span, up to the maximum of the client's
+        `AdaptiveLimit`, which decides how many fetches are in flight.
+        """
         if self._pool:
             return self._pool
         else:
             sl = len(self.spans())
-            self._pool = ThreadPool(16 if sl > 16 else sl) if sl else None
+            most = self.client.session.limit.maximum
+            self._pool = mp.ThreadPool(most if sl > most else sl) if sl else None
             return self._pool
 
-    def _slice(self, cursor, start, end, max_retries=3):
-        """Slice a set of spans and events.
+    def projected(self, columns):
+        """Get a cursor over the same query returning only some columns.
 
-        TODO: Add descriptions
+        Returns this cursor if the query already has explicit projections or
+        if no stream paths are given.
 
         Arguments:
-            cursor      --
-            start       --
-            end         --
-            max_retries --
+            columns -- the `StreamPath` columns to return.
+        """
+        returning = projection(columns)
+        if self.returning is not None or not returning:
+            return self
+        key = tuple(sorted(str(c) for c in columns))
+        if not hasattr(self, '_projections'):
+            self._projections = {}
+        if key not in self._projections:
+            self._projections[key] = self._requery(returning)
+        return self._projections[key]
+
+    def _requery(self, returning):
+        """Resubmit the query with different projections."""
+        return Cursor(self.client, self.query, returning, self._limit, self._offset, self._checkpoint)
+
+    def _slice(self, cursor, start, end):
+        """Slice the events of a span.
+
+        Pages are requested through the client's session, so failed
+        requests are retried according to its `RetryPolicy`.
+
+        Arguments:
+            cursor -- the cursor of the span.
+            start  -- the start of the slice.
+            end    -- the end of the slice.
         """
         streams = {}
-        retries = 0
-        c = "{}+{}Z+{}Z".format(
-            cursor.split("+")[0],
-            start.replace(tzinfo=None).isoformat(),
-            end.replace(tzinfo=None).isoformat()
-        )
+        c = slice_cursor(cursor, start, end)
+        if self._checkpoint:
+            done = self._checkpoint.completed(self._key, c)
+            if done is not None:
+                return {'start': start, 'end': end, 'streams': done}
+
+        for page in self._pages(c):
+            for sid, s in page.items():
+                if sid not in streams:
+                    streams[sid] = s
+                else:
+                    streams[sid]['events'].extend(s['events'])
+
+        if self._checkpoint:
+            self._checkpoint.slice(self._key, c, list(streams.values()))
+        return {'start': start, 'end': end, 'streams': list(streams.values())}
+
+    def _pages(self, c):
+        """Yield the pages of a slice as they arrive.
+
+        Arguments:
+            c -- the cursor of the slice.
+
+        Returns:
+            pages -- a generator of dictionaries mapping stream ids to
+                     `{'stream': stream, 'events': [events]}`.
+        """
+        for resp in self._responses(c):
+            yield group_events(self.client.decode(resp))
 
-        while c is not None:
+    def _responses(self, c):
+        """Yield the responses of the pages of a slice.
+
+        The next page downloads while the current one is processed.
+        """
+        def fetch(c):
             url = '{host}/query/{cursor}/events'.format(host=self.client.host, cursor=c)
-            resp = self.client.session.get(url)
+            return handle(self.client.session.get(url))
 
-            if not resp.ok and retries >= max_retries:
-                raise Exception("failed to get cursor")
-            elif not resp.ok:
-                retries += 1
-                continue
-            else:
-                retries = 0
-                c = resp.headers.get('cursor')
-                data = resp.json()
-
-                # using stream_obj var name to avoid clashing with imported
-                # stream function from flare.py
-                # initialize stream if it doesn't exist already
-                for sid, stream_obj in data['streams'].items():
-                    if sid not in streams:
-                        streams[sid] = {'stream': stream_obj, 'events': []}
-
-                # process each event
-                for event in data['events']:
-                    events = streams[event['stream']]['events']
-                    ss = streams[event['stream']]['stream']
-                    del event['stream']
-                    events.append(event)
-        return {'start': start, 'end': end, 'streams': list(streams.values())}
+        resp = fetch(c)
+        while resp is not None:
+            c = resp.headers.get('cursor')
+            page = Background(fetch, c) if c is not None else None
+            yield resp
+            resp = page.get() if page is not None else None
+
+    def _decode_slice(self, cursor, start, end, procs):
+        """Slice the events of a span, decoding its pages in other processes.
+
+        Pages are handed to the process pool as they arrive, and decoded
+        and turned into frames there, so decoding runs on every core while
+        later pages download.
+
+        Arguments:
+            cursor -- the cursor of the span.
+            start  -- the start of the slice.
+            end    -- the end of the slice.
+            procs  -- a `multiprocessing.Pool`.
+
+        Returns:
+            frames -- a dictionary of event frames, as returned by `df`.
+        """
+        c = slice_cursor(cursor, start, end)
+        backend = self.client.json.backend
+        parts = [procs.apply_async(decode_frames, (resp.content, resp.headers.get('content-type', ''), backend))
+                 for resp in self._responses(c)]
+        frames = {}
+        for part in parts:
+            for k, v in part.get().items():
+                frames.setdefault(k, []).append(v)
+        return {k: v[0] if len(v) == 1 else pd.concat(v, ignore_index=True)
+                for k, v in frames.items()}
+
+    def _resample(self, cursor, start, end, resampler):
+        """Aggregate the events of a slice into buckets of time.
+
+        Pages are aggregated as they arrive, so only the accumulators of
+        the buckets are kept in memory.
+
+        Arguments:
+            cursor    -- the cursor of the span.
+            start     -- the start of the slice.
+            end       -- the end of the slice.
+            resampler -- the `Resampler` to add the events to.
+        """
+        c = slice_cursor(cursor, start, end)
+        for page in self._pages(c):
+            resampler.add(df(start, {'streams': list(page.values())}))
+        return resampler
+
+    def _load(self, cursor, start, end, procs=None):
+        """Slice the events of a span into frames, in `procs` if given."""
+        if procs is not None:
+            return self._decode_slice(cursor, start, end, procs)
+        return df(start, self._slice(cursor, start, end))
+
+    def _frames(self, frames, compact=False, downcast=False):
+        """Convert event frames to compact dtypes, if asked to."""
+        if compact or downcast:
+            frames = {k: compact_frame(v, self.client.schema(stream(k)) if compact else None,
+                                       downcast, categories=compact)
+                      for k, v in frames.items()}
+        return frames
 
     def json(self):
         """Return query results as a JSON string.
@@ -491,37 +732,100 @@ class Cursor(object):
         self.spans()
         pool = self.pool
         if not pool:
-            return json.dumps([])
+            return self.client.json.dumps([])
         try:
             data = pool.map(lambda s: self._slice(s['cursor'], s.get('start') or DTMIN, s.get('end') or DTMAX), self._spans)
-            return json.dumps(data, default=dts, indent=4)
+            return self.client.json.dumps(data, indent=4)
         finally:
             pool.close()
+            self._pool = None
+
+
+    def to_json(self, fileobj, format="ndjson", indent=None):
+        """Write query results to a file as slices arrive.
 
+        Spans are written in order, one at a time, so output starts with the
+        first slice. Only as many slices as the client's `AdaptiveLimit`
+        maximum are fetched ahead of the writer, so memory use doesn't grow
+        with the size of the results.
+
+        >>> with open("results.ndjson", "w") as f:
+        ...     cursor.to_json(f)
+
+        Arguments:
+            fileobj -- a text or binary file object to write to.
+            format  -- `ndjson` for one JSON object per span and line, or
+                       `json` for a JSON array of spans as in `json()`.
+            indent  -- indent `json` output by this many spaces.
+
+        Returns:
+            count -- the number of spans written.
+        """
+        if format not in ("ndjson", "json"):
+            raise SentenaiException("Unknown format: {}".format(format))
+        binary = isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(fileobj, 'mode', '')
+
+        def write(text):
+            fileobj.write(text.encode('utf-8') if binary else text)
+
+        def fetch(s):
+            return self._slice(s['cursor'], s.get('start') or DTMIN, s.get('end') or DTMAX)
+
+        self.spans()
+        pool = self.pool
+        spans = iter(self._spans if pool else [])
+        ahead = deque(pool.apply_async(fetch, (s,))
+                      for s in islice(spans, self.client.session.limit.maximum))
+
+        count = 0
+        if format == "json":
+            write("[")
+        while ahead:
+            data = ahead.popleft().get()
+            ahead.extend(pool.apply_async(fetch, (s,)) for s in islice(spans, 1))
+            text = self.client.json.dumps(data, indent=indent)
+            if format == "ndjson":
+                write(text + "\n")
+            else:
+                write(("," if count else "") + ("\n" if indent else "") + text)
+            count += 1
+        if format == "json":
+            write(("\n" if indent and count else "") + "]")
+        return count
+
+    def _fetch_spans(self):
+        """Page through the spans of the query.
+
+        Paging stops as soon as `offset + limit` spans have been fetched.
+        """
+        pages = []
+        count = 0
+        cid = self.query_id
+        want = None if self._limit is None else self._offset + self._limit
+        if self._checkpoint:
+            for page in self._checkpoint.state(self._key)['pages']:
+                pages.append(Spans.parse(page['spans']))
+                count += len(pages[-1])
+                cid = page['cursor']
+        while cid and (want is None or count < want):
+            if want is None:
+                url = '{0}/query/{1}/spans'.format(self.client.host, cid)
+            else:
+                url = '{0}/query/{1}/spans?limit={2}'.format(self.client.host, cid, want - count)
+            r = self.client.decode(handle(self.client.session.get(url, headers=self.headers)))
+
+            pages.append(Spans.parse(r['spans']))
+            count += len(pages[-1])
+
+            cid = r.get('cursor')
+            if self._checkpoint:
+                self._checkpoint.page(self._key, r['spans'], cid)
+        return Spans.concat(pages)[self._offset:want]
 
     def spans(self, refresh=False):
         """Get list of spans of time when query conditions are true."""
         if refresh or not hasattr(self, "_spans"):
-            spans = []
-            cid = self.query_id
-            while cid:
-                if self._limit is None:
-                    url = '{0}/query/{1}/spans'.format(self.client.host, cid)
-                else:
-                    url = '{0}/query/{1}/spans?limit={2}'.format(self.client.host, cid, self._limit)
-                r = handle(self.client.session.get(url, headers=self.headers)).json()
-
-                for s in r['spans']:
-                    if 'start' in s and s['start']:
-                        s['start'] = cts(s['start'])
-                    if 'end' in s and s['end']:
-                        s['end'] = cts(s['end'])
-                spans.extend(r['spans'])
-
-                cid = r.get('cursor')
-                if self._limit and spans >= self._limit:
-                    break
-            self._spans = spans
+            self._spans = self._fetch_spans()
         sps = []
         for x in self._spans:
             z = {}
@@ -532,25 +836,62 @@ class Cursor(object):
             sps.append(z)
         return sps
 
-    def stats(self):
-        """Get time-based statistics about query results."""
-        self.spans()
-        deltas = [sp['end'] - sp['start'] for sp in self._spans if sp.get('start') and sp.get('end')]
+    def spans_store(self, refresh=False):
+        """Get the spans of the query as a compact `Spans` object."""
+        self.spans(refresh)
+        return self._spans
+
+    def inverse(self, min_gap=None):
+        """Get the gaps between the spans of the query.
+
+        Gaps are bounded by the start and end of the query's `select`, if
+        any. Without any spans there is no cursor to slice events with, so
+        there are no gaps either.
+
+        Arguments:
+            min_gap -- drop gaps shorter than this timedelta or `delta()`.
+        """
+        start, end = None, None
+        if isinstance(self.query, Select):
+            start, end = self.query._after, self.query._before
+        gaps = self.spans_store().complement(start, end, min_gap)
+        return gaps[gaps.cursors >= 0]
+
+    def union(self, other):
+        """Get the spans of time matched by this query or another.
+
+        Arguments:
+            other -- another cursor.
+        """
+        return self.spans_store().union(other.spans_store())
+
+    def intersection(self, other):
+        """Get the spans of time matched by both this query and another.
+
+        Arguments:
+            other -- another cursor.
+        """
+        return self.spans_store().intersection(other.spans_store())
+
+    def stats(self, percentiles=(5, 25, 75, 95), bins=10):
+        """Get time-based statistics about query results.
 
-        if not len(deltas):
-            return {}
+        Arguments:
+            percentiles -- percentiles of span durations to compute.
+            bins        -- the number of bins of the histogram of durations.
 
-        mean = sum([3600*24*d.days + d.seconds for d in deltas]) / float(len(deltas))
-        return {
-            'min': min(deltas),
-            'max': max(deltas),
-            'mean': timedelta(seconds=mean),
-            'median': sorted(deltas)[len(deltas)//2],
-            'count': len(deltas),
-        }
+        Returns:
+            stats -- the `min`, `max`, `mean` and `median` span durations,
+                     the `count` of spans, duration `percentiles`, a duration
+                     `histogram` and the same statistics of the `gaps`
+                     between spans. See `Spans.stats`.
+        """
+        self.spans()
+        return self._spans.stats(percentiles, bins)
 
 
-    def dataset(self, window=None, align=CENTER, freq=None):
+    def dataset(self, window=None, align=CENTER, freq=None, limit=None, method='ffill', tolerance=None,
+                agg=None, streaming=False, compact=False, downcast=False, processes=None, coalesce=True):
         """
         The `dataset` method returns the event data from a query.
         It's return type is a "FrameGroup" which can wrap multiple
@@ -559,9 +900,36 @@ class Cursor(object):
         stream data. The query result can optionally be aligned to the
         LEFT or RIGHT side of the window using the `align` variable. It
         defaults to `CENTER`. When multiple streams have different sample
-        rates, it can be handy to specify a `freq` to use. This will engage
-        the forward filling capabilities of Pandas to normalize the dataframes.
+        rates, it can be handy to specify a `freq` to use. All streams are
+        then aligned onto one time grid at that frequency, taking the last
+        event at or before each grid time (`method='ffill'`) or the closest
+        one (`method='nearest'`), and leaving grid times with no event
+        within `tolerance` empty. See `sentenai.align.align`.
+        Streams can instead be down-sampled to buckets of `freq` with the
+        aggregates in `agg`, such as `{'stream:column': 'mean'}`. See
+        `sentenai.align.Resampler`. With `streaming`, the pages of each
+        slice are aggregated as they arrive rather than once the whole
+        slice has been downloaded.
+        With `compact`, columns get dtypes from the schema of their stream
+        (see `Sentenai.schema`) and repeated strings become categoricals.
+        With `downcast`, numbers are also stored in 32 bits when they fit.
+        See `sentenai.schema.compact`.
+        Pages are decoded and turned into frames in a pool of `processes`
+        worker processes when given, rather than in the download threads.
+        The pool is kept by the client for later calls. Its workers import
+        the main module, so scripts must guard their entry point with
+        `if __name__ == '__main__'`. Neither `streaming` nor `processes` can record slices, so they can't
+        be used with a checkpoint.
+        With `coalesce`, overlapping and adjacent windows are fetched as a
+        single slice and their frames carved out of it, so events shared by
+        windows are only downloaded once. The `metrics` of the returned
+        `FrameGroup` count the windows, fetches, events and bytes involved.
+        The optional `limit` only downloads the events of the first `limit`
+        spans. Frames are yielded in order as soon as their slice arrives.
         """
+        check_aggregation(freq, agg, streaming)
+        check_checkpoint(self, streaming, processes)
+        metrics = {}
 
         if isinstance(window, Delta):
             window = window.timedelta
@@ -580,49 +948,89 @@ class Cursor(object):
                 w = window / 2
                 return (cursor, mp - w, mp + w)
 
-        def iterator(inverted):
-            self.spans()
-            if not inverted:
-                spans = self._spans
-            elif self._spans:
-                spans = [(DTMIN, self._spans[0][0])]
-                for (t0,t1), (u0, u1) in zip(self._spans, self._spans[1:]):
-                    spans.append((t1, u0))
-            else:
-                spans = []
-
-            pool = self.pool
-            for start, data in pool.map(lambda s: (s[1], self._slice(*s)), [win(**sp) for sp in spans]):
-                fr = df(start, data)
-                for s in fr.keys():
-                    if fr[s].empty:
-                        del fr[s]
+        def iterator(inverted, columns=()):
+            cur = self.projected(columns)
+            spans = cur.inverse() if inverted else cur.spans_store()
 
-                if freq:
-                    fr = {k: fr[k].set_index(keys=['.ts'])
-                                  .resample(freq).ffill()
-                                  .reset_index()
-                                  for k in fr}
+            if limit is not None:
+                spans = spans[:limit]
 
+            windows = [win(**sp) for sp in spans]
+            if coalesce:
+                fetches = plan_fetches(windows)
+            else:
+                fetches = [(w[0], w[1], w[2], [i]) for i, w in enumerate(windows)]
+
+            def fetch(f):
+                cursor, start, end, members = f
+                carver = Carver([windows[i][1:] for i in members])
+                if streaming:
+                    carver.sinks = [Resampler(freq, agg) for _ in members]
+                    cur._resample(cursor, start, end, carver)
+                    return members, carver.sinks, carver
+                parts = carver.carve(cur._load(cursor, start, end, procs=procs))
+                return members, [cur._frames(p, compact, downcast) for p in parts], carver
+
+            metrics.clear()
+            metrics.update({'windows': len(windows), 'fetches': len(fetches), 'events': 0,
+                            'events_fetched': 0, 'bytes_fetched': 0, 'bytes_saved': 0})
+            received = self.client.session.received
+            pool = cur.pool
+            procs = self.client._process_pool(processes) if processes and not streaming and pool else None
+            done, nxt = {}, 0
+            for members, parts, carver in (pool.imap(fetch, fetches) if pool else ()):
+                measure(metrics, carver, self.client.session.received - received)
+                done.update(zip(members, parts))
+                # windows are yielded in order once every earlier one is
+                while nxt in done:
+                    yield combine(done.pop(nxt))
+                    nxt += 1
+
+        def combine(data):
+            if streaming:
+                return data.frame()
+
+            fr = data
+            for s in list(fr.keys()):
+                if fr[s].empty:
+                    del fr[s]
+
+            if agg is not None:
+                return aggregate(fr, freq, agg)
+
+            if freq:
+                return align_frames(fr, freq, method, tolerance)
+
+            for s in fr.keys():
+                fr[s] = fr[s].set_index(keys=['.ts'])
+                fr[s].rename(columns={k: s + ":" + k for k in fr[s].columns}, inplace=True)
+
+            if len(fr.keys()) > 1:
+                to_join = list(fr.values())
+                return pd.DataFrame.join(to_join[0], to_join[1:], how="outer").reset_index()
+            elif fr:
+                return list(fr.values())[0].reset_index()
+            else:
+                return pd.DataFrame()
 
-                for s in fr.keys():
-                    fr[s] = fr[s].set_index(keys=['.ts'])
-                    fr[s].rename(columns={k: s + ":" + k for k in fr[s].columns}, inplace=True)
-
-                if len(fr.keys()) > 1:
-                    to_join = list(fr.values())
-                    dff = pd.DataFrame.join(to_join[0], to_join[1:], how="outer").reset_index()
-                elif fr:
-                    dff = list(fr.values())[0].reset_index()
-                else:
-                    dff = pd.DataFrame()
+        return FrameGroup(iterator, metrics=metrics)
 
-                yield dff
 
-        return FrameGroup(iterator)
+    def sliding(self, lookback, horizon, slide, freq, limit=None, method='ffill', tolerance=None,
+                agg=None, streaming=False, compact=False, downcast=False, processes=None):
+        """Return sliding windows over the event data of a query.
 
+        Each window covers `lookback + horizon`, windows start every `slide`
+        within each span, and streams are aligned onto a grid at `freq`, or
+        aggregated into buckets of `freq` with `agg`, and columns are made
+        `compact` as in `dataset`. The optional `limit` stops downloading
+        slices once `limit` windows are produced.
 
-    def sliding(self, lookback, horizon, slide, freq):
+        As in `dataset`, pages are decoded and turned into frames in a pool
+        of `processes` worker processes when given.
+        """
+        check_aggregation(freq, agg, streaming)
+        check_checkpoint(self, streaming, processes)
         if isinstance(lookback, Delta):
             lookback = lookback.timedelta
         if isinstance(horizon, Delta):
@@ -636,66 +1044,245 @@ class Cursor(object):
                 yield (start + cslide, start + cslide + lookback + horizon)
                 cslide += slide
 
-        def shape(inverted):
-            self.spans()
-            if not inverted:
-                spans = self._spans
-            elif self._spans:
-                spans = [{'cursor': self._spans[0]['cursor'], 'start': "1900-01-01T00:00:00Z", 'end': self._spans[0]['start']}]
-                for t0, t1 in zip(self._spans, self._spans[1:]):
-                    spans.append({'cursor': t0['cursor'], 'start': t0['end'], 'end': t1['start']})
-            rows = 0
-            for sp in spans:
-                rows += len([x for x in slides(sp['start'], sp['end'])])
-            return (rows, len(pd.date_range(t0, t1, freq=freq, closed='right')))
-
-        def iterator(inverted):
-            self.spans()
-            if not inverted:
-                spans = self._spans
-            elif self._spans:
-                if 'start' in self._spans[0]:
-                    spans = [{'cursor': self._spans[0]['cursor'], 'start': "1900-01-01T00:00:00Z", 'end': self._spans[0]['start']}]
-                else:
-                    spans = []
-                for t0, t1 in zip(self._spans, self._spans[1:]):
-                    spans.append({'cursor': t0['cursor'], 'start': t0.get('end', DTMAX), 'end': t1.get('start', DTMIN)})
+        def iterator(inverted, columns=()):
+            cur = self.projected(columns)
+            if inverted:
+                # windows can only slide over gaps with a start and an end
+                spans = cur.inverse()
+                spans = spans[spans.closed()]
             else:
-                spans = []
+                spans = cur.spans_store()
+            procs = self.client._process_pool(processes) if processes and not streaming else None
+            for window in windows(cur, spans, procs):
+                yield window
+
+        def windows(cur, spans, procs):
+            produced = 0
             for sp in spans:
-                start, end, cur = sp.get('start', DTMIN), sp.get('end', DTMAX), sp['cursor']
-                data = self._slice(cur, start, end + horizon)
-                fr = df(start, data)
-                fr = {k: fr[k].set_index(keys=['.ts'])
-                              .resample(freq).ffill()
-                              .reset_index()
-                              for k in fr}
-                fts = max(fr[k]['.ts'][0] for k in fr)
-                lts = min(fr[k]['.ts'][-1] for k in fr) + timedelta(seconds=1)
-
-                for s in fr.keys():
-                    fr[s] = fr[s].set_index(keys=['.ts'])
-                    fr[s].rename(columns={k: s + ":" + k for k in fr[s].columns}, inplace=True)
-
-                if len(fr.keys()) > 1:
-                    to_join = list(fr.values())
-                    dff = pd.DataFrame.join(to_join[0], to_join[1:], how="outer").reset_index()
+                if limit is not None and produced >= limit:
+                    return
+                start, end, token = sp.get('start', DTMIN), sp.get('end', DTMAX), sp['cursor']
+                if streaming:
+                    resampler = cur._resample(token, start, end + horizon, Resampler(freq, agg))
                 else:
-                    dff = list(fr.values())[0].reset_index()
+                    data = cur._load(token, start, end + horizon, procs)
+                    fr = {k: v for k, v in cur._frames(data, compact, downcast).items() if not v.empty}
+                    if agg is not None:
+                        resampler = Resampler(freq, agg).add(fr)
+                if agg is not None:
+                    bounds = list(resampler.bounds().values())
+                elif fr:
+                    bounds = [(g[0], g[-1]) for g in (time_grid({k: fr[k]}, freq) for k in fr)]
+                else:
+                    bounds = []
+                if not bounds:
+                    continue
+                # windows only cover the time every stream has data for
+                fts = max(b[0] for b in bounds)
+                lts = min(b[1] for b in bounds) + timedelta(seconds=1)
+                if agg is not None:
+                    dff = resampler.frame()
+                else:
+                    dff = align_frames(fr, freq, method, tolerance)
 
                 for t0, t1 in slides(fts, lts):
                     p = dff[(dff['.ts'] >= t0) & (dff['.ts'] < t1)]
                     if len(p) == len(pd.date_range(t0, t1, freq=freq, closed='right')):
                         yield p
+                        produced += 1
+                        if limit is not None and produced >= limit:
+                            return
 
         return FrameGroup(iterator)
 
 
+class CompositeCursor(Cursor):
+    """A cursor over the combined results of several queries.
+
+    The queries are submitted and their spans fetched concurrently. How the
+    span lists are combined is defined by subclasses.
+    """
+
+    def __init__(self, client, query, queries, returning=None, limit=None, offset=None, checkpoint=None):
+        """Submit the queries.
+
+        Arguments:
+            client     -- a Sentenai client.
+            query      -- the original query.
+            queries    -- the queries to execute in its place.
+            returning  -- the projections of the query.
+            limit      -- a limit to the number of combined result spans.
+            offset     -- the number of leading combined spans to skip.
+            checkpoint -- an optional `Checkpoint` shared by every query.
+        """
+        self.client = client
+        self.query = query
+        self.returning = returning
+        self._limit = limit
+        self._offset = offset or 0
+        self.headers = {'content-type': 'application/json', 'auth-key': client.auth_key}
+        self.query_id = None
+        self._pool = None
+        self._checkpoint = checkpoint
+        self._key = query_key(ast_dict(query, returning)) if checkpoint else None
+
+        pool = mp.ThreadPool(len(queries))
+        try:
+            # combining can merge spans, so every query is fetched in full
+            self._cursors = pool.map(lambda q: Cursor(client, q, returning, checkpoint=checkpoint), queries)
+        finally:
+            pool.close()
+
+    def _fetch_spans(self):
+        """Fetch the spans of every query concurrently and combine them."""
+        pool = mp.ThreadPool(len(self._cursors))
+        try:
+            parts = pool.map(lambda c: c._fetch_spans(), self._cursors)
+        finally:
+            pool.close()
+        spans = Spans.parse(self.combine(parts))
+        return spans[self._offset:None if self._limit is None else self._offset + self._limit]
+
+    def combine(self, parts):
+        """Combine the span lists of the queries into one."""
+        raise NotImplementedError
+
+    def _merge_slices(self, slices, start, end):
+        """Merge the slices of several queries over the same span."""
+        streams = {}
+        for data in slices:
+            for s in data['streams']:
+                if s['stream'] in streams:
+                    streams[s['stream']]['events'].extend(s['events'])
+                else:
+                    streams[s['stream']] = s
+        return {'start': start, 'end': end, 'streams': list(streams.values())}
+
+    def _decode_slice(self, cursor, start, end, procs):
+        """Slice the events of a span into frames in this process.
+
+        The slices of the queries have to be merged before they can become
+        frames, so their pages are decoded as they arrive instead.
+        """
+        return df(start, self._slice(cursor, start, end))
+
+    def _resample(self, cursor, start, end, resampler):
+        """Aggregate the events of a slice once it has been merged."""
+        return resampler.add(df(start, self._slice(cursor, start, end)))
+
+
+class ShardedCursor(CompositeCursor):
+    """A cursor over a query whose time range is split into shards.
+
+    Each shard of the `select(start, end)` range is submitted as its own
+    query, and the spans of all shards are fetched concurrently and stitched
+    into one time ordered list. A span that runs up to the end of a shard and
+    one that resumes at the start of the next shard are merged into a single
+    span.
+
+    Note: queries with duration constraints (`min`, `max`, `exactly`),
+    serial patterns or switches can't be sharded. Their matches depend on
+    spans which may cross a shard boundary, so the stitched results would
+    both miss and invent matches.
+    """
+
+    def __init__(self, client, query, returning=None, limit=None, offset=None, shards=2, checkpoint=None):
+        if not isinstance(query, Select) or not (query._after and query._before):
+            raise SentenaiException("Sharded queries require `select(start, end)`")
+        if unshardable(query()):
+            raise SentenaiException("Duration constraints, serial patterns and switches can't be sharded")
+
+        def shard(bounds):
+            q = Select(start=bounds[0], end=bounds[1])
+            q._query = query._query
+            return q
+
+        self._bounds = shard_bounds(query._after, query._before, shards)
+        CompositeCursor.__init__(
+            self, client, query, [shard(b) for b in self._bounds], returning, limit, offset, checkpoint)
+
+    def combine(self, parts):
+        return stitch([(b[1], p) for b, p in zip(self._bounds, parts)])
+
+    def _requery(self, returning):
+        return ShardedCursor(self.client, self.query, returning,
+                             self._limit, self._offset, len(self._bounds), self._checkpoint)
+
+    def _slice(self, cursor, start, end):
+        """Slice events from every shard overlapping a span.
+
+        Arguments:
+            cursor -- the cursor of the span. Ignored in favor of the
+                      cursors of the overlapping shards.
+            start  -- the start of the span.
+            end    -- the end of the span.
+        """
+        slices = []
+        for (s0, s1), shard in zip(self._bounds, self._cursors):
+            if start < s1 and end > s0:
+                slices.append(Cursor._slice(
+                    self, shard.query_id, max(start, s0), min(end, s1)))
+        return self._merge_slices(slices, start, end)
+
+
+class ChunkedCursor(CompositeCursor):
+    """A cursor over a query whose largest `in` list is split into chunks.
+
+    Membership conditions over very large lists of values are executed as
+    several smaller queries, one per chunk of values, and the union of their
+    spans is the result of the original query.
+    """
+
+    def __init__(self, client, query, chunks, returning=None, limit=None, offset=None, checkpoint=None):
+        self._chunks = chunks
+        queries = [ChunkQuery(c) for c in chunks]
+        CompositeCursor.__init__(self, client, query, queries, returning, limit, offset, checkpoint)
+
+    def combine(self, parts):
+        return Spans.concat(parts).union()
+
+    def _requery(self, returning):
+        return ChunkedCursor(self.client, self.query, self._chunks, returning,
+                             self._limit, self._offset, self._checkpoint)
+
+    def _slice(self, cursor, start, end):
+        """Slice events of a span from every chunk.
+
+        Events matched by several chunks are only returned once.
+        """
+        data = self._merge_slices(
+            [Cursor._slice(self, c.query_id, start, end) for c in self._cursors],
+            start, end)
+        for s in data['streams']:
+            seen = set()
+            events = []
+            for evt in s['events']:
+                if evt.get('id') not in seen:
+                    seen.add(evt.get('id'))
+                    events.append(evt)
+            s['events'] = sorted(events, key=lambda e: e.get('ts'))
+        return data
+
+
+class ChunkQuery(object):
+    """The query of one chunk of a split query AST.
+
+    Calling it returns a fresh copy of the AST, like calling a query does,
+    as `ast_dict` adds the projections of each request to the tree.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __call__(self):
+        return copy.deepcopy(self.tree)
+
 
 class FrameGroup(object):
-    def __init__(self, iterator, inverted=False):
+    def __init__(self, iterator, inverted=False, metrics=None):
         self.iterator = iterator
         self.inverted = inverted
+        self.metrics = {} if metrics is None else metrics
 
     def inverse(self):
         """
@@ -703,7 +1290,7 @@ class FrameGroup(object):
         the times between the start and end of found
         patterns.
         """
-        return FrameGroup(self.iterator, inverted=True)
+        return FrameGroup(self.iterator, inverted=True, metrics=self.metrics)
 
     def dataframes(self, *columns, **kwargs):
         """
@@ -714,14 +1301,18 @@ class FrameGroup(object):
         def cname(stream, path):
             return "{}:{}".format(stream['name'], ".".join(path[1:]))
 
-        for df in self.iterator(self.inverted):
+        def col(p):
+            return p if isinstance(p, str) else cname(**p())
+
+        # only the requested stream paths are downloaded
+        for df in self.iterator(self.inverted, columns):
             if drop_prefixes:
                 # TODO: Figure out what needs to happen if names overlap
-                z = df[[cname(**p()) if p != ".ts" else p for p in columns]].copy() if columns else df.copy()
+                z = df[[col(p) for p in columns]].copy() if columns else df.copy()
                 z.rename(columns={k: k.split(":", 1)[1] for k in z.columns if ":" in k}, inplace=True)
                 yield z
             else:
-                yield df[[cname(**p()) for p in columns]] if columns else df
+                yield df[[col(p) for p in columns]] if columns else df
 
     def tensor(self, *columns, **kwargs):
         return np.stack(self.dataframes(*columns, **kwargs))
@@ -761,7 +1352,7 @@ class FrameGroup(object):
                 df['.delta'] = df['.ts'].apply(lambda ts: ts - df['.ts'][0])
                 dfs.append(df)
         if dfs:
-            rdf = pd.concat(dfs)
+            rdf = concat_frames(dfs)
             rdf.set_index(['.ts', '.span', '.delta'], inplace=True)
             return rdf
         else:
@@ -779,6 +1370,7 @@ class FrameGroup(object):
 
 
 def df(t0, data):
+    from pandas.io.json import json_normalize
     dfs = {}
     for s in data['streams']:
         events = []
@@ -790,6 +1382,306 @@ def df(t0, data):
         dfs[s['stream']] = json_normalize(events)
     return dfs
 
+def plan_fetches(windows):
+    """Merge overlapping and adjacent windows into as few slices as possible.
+
+    Windows of the same query whose time ranges overlap or touch are
+    fetched as one slice covering all of them.
+
+    Arguments:
+        windows -- a list of `(cursor, start, end)` tuples.
+
+    Returns:
+        fetches -- a list of `(cursor, start, end, members)` tuples, where
+                   `members` are the indices of the windows the slice
+                   covers, ordered by their first window.
+    """
+    order = sorted(range(len(windows)),
+                   key=lambda i: (windows[i][0].split("+")[0], windows[i][1], windows[i][2]))
+    fetches = []
+    for i in order:
+        cursor, start, end = windows[i]
+        last = fetches[-1] if fetches else None
+        if last and last[0].split("+")[0] == cursor.split("+")[0] and start <= last[2]:
+            last[2] = max(last[2], end)
+            last[3].append(i)
+        else:
+            fetches.append([cursor, start, end, [i]])
+    for f in fetches:
+        f[3].sort()
+    fetches.sort(key=lambda f: f[3][0])
+    return [tuple(f) for f in fetches]
+
+
+class Carver(object):
+    """Carve the frames of one slice into the windows it covers.
+
+    Each window gets the events at or after its start and before its end.
+    With `sinks`, carved frames are added to them as they arrive instead,
+    so the pages of a slice can be fed to one `Resampler` per window.
+    """
+
+    def __init__(self, bounds, sinks=None):
+        """Initialize the carver.
+
+        Arguments:
+            bounds -- a list of the `(start, end)` of each window.
+            sinks  -- an optional list of objects with an `add(frames)`
+                      method, one per window.
+        """
+        self.bounds = [(stamp(start), stamp(end)) for start, end in bounds]
+        self.sinks = sinks
+        self.fetched = 0
+        self.carved = 0
+
+    def carve(self, frames):
+        """Split a dictionary of event frames into one per window."""
+        self.fetched += sum(len(f) for f in frames.values())
+        if len(self.bounds) == 1:
+            self.carved += sum(len(f) for f in frames.values())
+            return [frames]
+        ts = {k: pd.DatetimeIndex(f['.ts']).asi8 for k, f in frames.items() if len(f)}
+        parts = []
+        for start, end in self.bounds:
+            part = {}
+            for k, f in frames.items():
+                if k in ts:
+                    f = f[(ts[k] >= start) & (ts[k] < end)].reset_index(drop=True)
+                part[k] = f
+                self.carved += len(f)
+            parts.append(part)
+        return parts
+
+    def add(self, frames):
+        for sink, part in zip(self.sinks, self.carve(frames)):
+            sink.add(part)
+        return self
+
+
+def stamp(t):
+    """Get a slice bound in epoch nanoseconds, clipping open bounds."""
+    try:
+        return pd.Timestamp(t).value
+    except (OverflowError, ValueError):
+        return SINCE if t.year < 1970 else OPEN
+
+
+def measure(metrics, carver, received):
+    """Update the metrics of a windowed dataset with a fetched slice.
+
+    Bytes saved are estimated from the bytes received per event fetched,
+    times the events the windows would have downloaded again on their own.
+    """
+    metrics['events'] += carver.carved
+    metrics['events_fetched'] += carver.fetched
+    metrics['bytes_fetched'] = received
+    if metrics['events_fetched']:
+        per_event = received / float(metrics['events_fetched'])
+        metrics['bytes_saved'] = int(per_event * (metrics['events'] - metrics['events_fetched']))
+
+
+def group_events(data):
+    """Group the events of a decoded page by stream.
+
+    Returns:
+        streams -- a dictionary mapping stream ids to
+                   `{'stream': stream, 'events': [events]}`.
+    """
+    # using stream_obj var name to avoid clashing with imported
+    # stream function from flare.py
+    streams = {}
+    for sid, stream_obj in data['streams'].items():
+        streams[sid] = {'stream': stream_obj, 'events': []}
+
+    # process each event
+    for event in data['events']:
+        events = streams[event['stream']]['events']
+        del event['stream']
+        events.append(event)
+    return streams
+
+
+def decode_frames(content, ctype, backend=None):
+    """Decode a page of events into a frame per stream.
+
+    This runs in the worker processes of `Cursor.dataset`, so it takes a
+    content type and the name of a JSON backend rather than a client, and
+    picks a codec the way `Sentenai.decode` does for the built in codecs.
+
+    Arguments:
+        content -- the body of the page.
+        ctype   -- the content type of the page.
+        backend -- the JSON backend to decode with.
+    """
+    if 'msgpack' in ctype:
+        data = get_codec('msgpack').decode(content)
+    else:
+        data = JSONCodec(backend).decode(content)
+    return df(None, {'streams': list(group_events(data).values())})
+
+
+def check_aggregation(freq, agg, streaming):
+    """Check the resampling arguments of `dataset` and `sliding`."""
+    if agg is not None and not freq:
+        raise SentenaiException("Aggregation requires a `freq`")
+    if streaming and agg is None:
+        raise SentenaiException("Streaming requires an aggregation")
+
+
+def check_checkpoint(cursor, streaming, processes):
+    """Check that slices will be recorded if a cursor has a checkpoint.
+
+    Streamed and process decoded slices never hold the events of the
+    whole slice, so they can't be recorded.
+    """
+    if cursor._checkpoint and (streaming or processes):
+        raise SentenaiException("Checkpointed queries can't be streamed or decoded in processes")
+
+
+def slice_cursor(cursor, start, end):
+    """Get the cursor of a slice of a span."""
+    return "{}+{}Z+{}Z".format(
+        cursor.split("+")[0],
+        start.replace(tzinfo=None).isoformat(),
+        end.replace(tzinfo=None).isoformat()
+    )
+
+
+def shard_bounds(start, end, shards):
+    """Split a range of time into equal, contiguous shards.
+
+    Arguments:
+        start  -- the start of the range.
+        end    -- the end of the range.
+        shards -- the number of shards.
+
+    Returns:
+        bounds -- a list of timezone aware `(start, end)` tuples.
+    """
+    start, end = utc(start), utc(end)
+    if end <= start:
+        raise SentenaiException("The end of a sharded query must follow its start")
+    step = (end - start) // shards
+    if not step:
+        return [(start, end)]
+    cuts = [start + step * i for i in range(1, shards)]
+    return list(zip([start] + cuts, cuts + [end]))
+
+
+def stitch(shards):
+    """Stitch the spans of adjacent shards together.
+
+    The last span of a shard is merged with the first span of the next shard
+    when the former reaches the shard boundary and the latter starts on it.
+    Spans with no `end` or no `start` are open and reach the boundary.
+
+    Arguments:
+        shards -- a time ordered list of `(boundary, spans)` tuples where
+                  `boundary` is the end of the shard.
+
+    Returns:
+        spans -- a single time ordered list of spans.
+    """
+    spans = []
+    boundary = None
+    for end, part in shards:
+        part = list(part)
+        if spans and part and boundary is not None:
+            prev, nxt = spans[-1], part[0]
+            if (not prev.get('end') or prev['end'] >= boundary) and \
+               (not nxt.get('start') or nxt['start'] <= boundary):
+                merged = dict(prev)
+                if 'end' in nxt:
+                    merged['end'] = nxt['end']
+                else:
+                    merged.pop('end', None)
+                spans[-1] = merged
+                part = part[1:]
+        spans.extend(part)
+        boundary = end
+    return spans
+
+
+def union(spans):
+    """Merge overlapping or touching spans.
+
+    Spans without a `start` or an `end` are open on that side.
+
+    Arguments:
+        spans -- a list of spans in any order.
+
+    Returns:
+        spans -- a time ordered list of disjoint spans.
+    """
+    return list(Spans.parse(spans).union())
+
+
+def unshardable(tree):
+    """Check whether a query AST constrains durations or sequences patterns.
+
+    Their matches depend on spans which may cross a shard boundary.
+
+    Arguments:
+        tree -- the AST of a query.
+    """
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, list):
+            nodes.extend(node)
+        elif isinstance(node, dict):
+            if node.get('type') in ('serial', 'switch'):
+                return True
+            if any(k in node for k in ('for', 'within', 'after')) and 'select' not in node:
+                return True
+            nodes.extend(node.values())
+    return False
+
+
+def chunk_ast(tree, size):
+    """Split the largest `in` list of a query AST into chunks.
+
+    The spans of a query are the union of the spans of its chunks as long as
+    the query has no sequences, switches or duration constraints, and the
+    list is not part of a stream filter. Otherwise the query is not split.
+
+    Arguments:
+        tree -- the AST of a query.
+        size -- the maximum number of values per chunk.
+
+    Returns:
+        chunks -- a list of ASTs.
+    """
+    best = None
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, list):
+            nodes.extend(node)
+        elif isinstance(node, dict):
+            if node.get('type') in ('serial', 'switch'):
+                return [tree]
+            if any(k in node for k in ('for', 'within', 'after')) and 'select' not in node:
+                return [tree]
+            if node.get('op') == 'in' and isinstance(node['arg']['val'], list):
+                if len(node['arg']['val']) > size and \
+                   (best is None or len(node['arg']['val']) > len(best['arg']['val'])):
+                    best = node
+            nodes.extend(v for k, v in node.items() if k != 'filter')
+
+    if best is None:
+        return [tree]
+    vals = best['arg']['val']
+    chunks = []
+    try:
+        for i in range(0, len(vals), size):
+            best['arg']['val'] = vals[i:i + size]
+            chunks.append(copy.deepcopy(tree))
+    finally:
+        best['arg']['val'] = vals
+    return chunks
+
+
 def build_url(host, stream, eid=None):
     """Build a url for the Sentenai API.
 
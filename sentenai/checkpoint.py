@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+
+from sentenai.codec import JSONCodec, default
+
+
+class Checkpoint(object):
+    """A local record of the progress of cursors.
+
+    Query ids, span pages with their continuation tokens and completed
+    event slices are appended to a file of JSON lines as they arrive, so a
+    cursor created over the same query in a new process resumes where the
+    previous one stopped instead of resubmitting the query and downloading
+    everything again.
+
+    Records are tagged with a hash of the query AST, so one file can hold
+    the progress of several queries. Slices are only indexed by their
+    offset in the file and read back when needed. A record cut short by a
+    crash is dropped when the file is loaded.
+
+    Note: query ids expire on the server, so checkpoints are only useful
+    for resuming recent downloads.
+    """
+
+    def __init__(self, path, codec=None):
+        """Load a checkpoint file, creating it on first write.
+
+        Arguments:
+            path  -- the path of the checkpoint file.
+            codec -- the `JSONCodec` to read and write records with.
+                     Defaults to the fastest JSON library installed.
+        """
+        self.path = path
+        self.codec = codec or JSONCodec()
+        self.lock = threading.Lock()
+        self.queries = {}
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        good = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    rec = self.codec.decode(line)
+                except ValueError:
+                    break
+                self._apply(rec, offset)
+                good = f.tell()
+        if good < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+    def _apply(self, rec, offset):
+        q = self.state(rec['key'])
+        if 'query_id' in rec:
+            q['query_id'] = rec['query_id']
+        elif 'page' in rec:
+            q['pages'].append(rec['page'])
+        elif 'slice' in rec:
+            q['slices'][rec['slice']] = offset
+
+    def _write(self, rec):
+        line = self.codec.encode(rec) + b'\n'
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(line)
+            self._apply(rec, offset)
+
+    def state(self, key):
+        """Get the recorded progress of a query.
+
+        Returns:
+            state -- a dictionary with the `query_id` if any, the list of
+                     span `pages` fetched and the file offsets of the
+                     `slices` completed, by slice cursor.
+        """
+        return self.queries.setdefault(key, {'query_id': None, 'pages': [], 'slices': {}})
+
+    def query_id(self, key, query_id):
+        """Record the id of a submitted query."""
+        self._write({'key': key, 'query_id': query_id})
+
+    def page(self, key, spans, cursor):
+        """Record a page of spans and the continuation token after it."""
+        self._write({'key': key, 'page': {'spans': spans, 'cursor': cursor}})
+
+    def slice(self, key, cursor, streams):
+        """Record the events of a completed slice."""
+        self._write({'key': key, 'slice': cursor, 'streams': streams})
+
+    def completed(self, key, cursor):
+        """Get the events of a completed slice, or None."""
+        offset = self.state(key)['slices'].get(cursor)
+        if offset is None:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return self.codec.decode(f.readline())['streams']
+
+
+def query_key(tree):
+    """Get a stable key for a query AST.
+
+    The key is hashed from the output of the `json` module rather than the
+    configured codec, as it must not change with the JSON library
+    installed or a checkpoint couldn't be resumed in another environment.
+    """
+    data = json.dumps(tree, default=default, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
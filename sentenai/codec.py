@@ -0,0 +1,141 @@
+import gzip
+import importlib
+import io
+import json
+
+from sentenai.exceptions import SentenaiException
+from sentenai.utils import dts
+
+
+# JSON libraries in order of preference.
+BACKENDS = ['orjson', 'ujson', 'json']
+
+
+class Codec(object):
+    """A wire encoding for request and response bodies."""
+
+    content_type = None
+
+    def encode(self, obj):
+        """Encode an object as bytes."""
+        raise NotImplementedError
+
+    def decode(self, data):
+        """Decode bytes into an object."""
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    """Compact JSON, the default encoding.
+
+    Uses the fastest JSON library available: `orjson`, then `ujson`, then
+    the standard library `json` module.
+    """
+
+    content_type = 'application/json'
+
+    def __init__(self, backend=None):
+        """Initialize the codec.
+
+        Arguments:
+            backend -- force a backend by name, `orjson`, `ujson` or `json`.
+                       Defaults to the fastest one installed.
+        """
+        for name in ([backend] if backend else BACKENDS):
+            try:
+                self.lib = importlib.import_module(name)
+            except ImportError:
+                if backend:
+                    raise SentenaiException("JSON backend {} is not installed".format(backend))
+            else:
+                self.backend = name
+                break
+        if self.backend == 'orjson':
+            # format datetimes and non-string keys like the json module does
+            self.options = self.lib.OPT_PASSTHROUGH_DATETIME | self.lib.OPT_NON_STR_KEYS
+
+    def encode(self, obj):
+        if self.backend == 'orjson':
+            return self.lib.dumps(obj, default=default, option=self.options)
+        return self.dumps(obj).encode('utf-8')
+
+    def decode(self, data):
+        if self.backend != 'orjson' and isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return self.lib.loads(data)
+
+    def dumps(self, obj, indent=None):
+        """Encode an object as a JSON string."""
+        if self.backend == 'orjson' and indent is None:
+            return self.encode(obj).decode('utf-8')
+        elif self.backend == 'ujson':
+            try:
+                return self.lib.dumps(obj, default=default, indent=indent or 0,
+                                      escape_forward_slashes=False)
+            except TypeError as e:
+                # ujson releases before 5.4 have no `default` hook
+                if 'default' not in str(e):
+                    raise
+        if indent is None:
+            return json.dumps(obj, default=default, separators=(',', ':'))
+        return json.dumps(obj, default=default, indent=indent)
+
+    loads = decode
+
+
+class MsgPackCodec(Codec):
+    """MessagePack, a compact binary encoding.
+
+    Requires the `msgpack` package.
+    """
+
+    content_type = 'application/msgpack'
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise SentenaiException("The msgpack codec requires `pip install msgpack`")
+        self.msgpack = msgpack
+
+    def encode(self, obj):
+        return self.msgpack.packb(obj, default=default, use_bin_type=True)
+
+    def decode(self, data):
+        return self.msgpack.unpackb(data, raw=False)
+
+
+def default(obj):
+    """Serialize datetimes as ISO8601 strings."""
+    serial = dts(obj)
+    if serial is obj:
+        raise TypeError("{!r} is not serializable".format(obj))
+    return serial
+
+
+CODECS = {
+    'json': JSONCodec,
+    'msgpack': MsgPackCodec,
+}
+
+
+def codec(name):
+    """Get a codec by name, or return a codec instance as is.
+
+    Arguments:
+        name -- `json`, `msgpack` or a `Codec` instance.
+    """
+    if isinstance(name, Codec):
+        return name
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise SentenaiException("Unknown codec: {}".format(name))
+
+
+def gzipped(data):
+    """Compress bytes with gzip."""
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
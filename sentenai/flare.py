@@ -1,5 +1,4 @@
 import inspect, json
-import numpy as np
 
 from datetime import date, datetime, timedelta
 
@@ -39,6 +38,8 @@ def delta(seconds=0, minutes=0, hours=0, days=0, weeks=0, months=0, years=0):
 class Flare(object):
     """A Flare query object."""
 
+    __slots__ = ()
+
     def __repr__(self):
         """An unambiguous representation of the Flare query."""
         return str(self)
@@ -78,23 +79,37 @@ class InCircle(Flare):
 class InPolygon(Flare):
     """Used in conjuction with a Cond an shapely.geometry.Polygon."""
 
-    def __init__(self, poly):
+    def __init__(self, poly, tolerance=None, prefilter=True):
         """Initalize the object.
 
         Arguments:
-            poly -- a shapely.geometry.Polygon object
+            poly      -- a shapely.geometry.Polygon object
+            tolerance -- simplify the polygon so that no point of the
+                         simplified boundary is further than `tolerance`
+                         from the original, in the units of the coordinate
+                         system. (optional)
+            prefilter -- add conditions on the bounding box of the polygon
+                         alongside the polygon condition. (default True)
         """
+        if tolerance:
+            poly = poly.simplify(tolerance, preserve_topology=True)
         self.poly = poly
+        self.tolerance = tolerance
+        self.prefilter = prefilter
+
+    def bounds(self):
+        """Get the `(min lon, min lat, max lon, max lat)` of the polygon."""
+        return self.poly.exterior.bounds
 
     def __call__(self):
         """Generate the object in AST format."""
-        vs = [{'lat': y, 'lon': x} for x, y in np.asarray(self.poly.exterior.coords)]  # NOQA
+        vs = [{'lat': y, 'lon': x} for x, y in self.poly.exterior.coords]
         return {"vertices": vs}
 
     def __str__(self):
         """A string representation of the object."""
         return "Polygon[{}]".format(", ".join(
-            ['{{lat: {},  lon: {}}}'.format(x, y) for x, y in np.asarray(self.poly.exterior.coords)]))  # NOQA
+            ['{{lat: {},  lon: {}}}'.format(x, y) for x, y in self.poly.exterior.coords]))
 
 
 @py2str
@@ -330,6 +345,8 @@ class Cond(Flare):
     >>> c = stream.attribute1 > 5
     """
 
+    __slots__ = ('path', 'op', 'val')
+
     def __init__(self, path, op, val):
         """Initialize the condition.
 
@@ -395,6 +412,16 @@ class Cond(Flare):
             d.update(self.path(stream))
         else:
             d.update(self.path())
+
+        if isinstance(self.val, InPolygon) and self.val.prefilter:
+            # cheap comparisons on the bounding box let most events skip the
+            # point in polygon test.
+            x0, y0, x1, y1 = self.val.bounds()
+            lat, lon = self.path._('lat'), self.path._('lon')
+            box = [Cond(lat, '>=', y0), Cond(lat, '<=', y1),
+                   Cond(lon, '>=', x0), Cond(lon, '<=', x1)]
+            key = 'expr' if isinstance(self.path, StreamPath) else 'type'
+            return {key: '&&', 'args': [c(stream) for c in box] + [d]}
         return d
 
     def __or__(self, q):
@@ -522,7 +549,8 @@ class Stream(object):
                     }
                 elif len(self._filters) == 1:
                     b['filter'] = self._filters[0]()
-                    del b['filter']['type']
+                    if b['filter'].get('type') == 'span':
+                        del b['filter']['type']
             return b
         else:
             try:
@@ -567,6 +595,8 @@ class EventPath(object):
     to create condition objects.
     """
 
+    __slots__ = ('__attrlist',)
+
     def __init__(self, namet=None):
         """Initialize the event path.
 
@@ -684,6 +714,8 @@ class StreamPath(object):
     Combine with operators like `==` and values to create condition objects.
     """
 
+    __slots__ = ('__stream', '__attrlist')
+
     def __init__(self, namet, stream=None):
         """Initalize the StreamPath.
 
@@ -1075,8 +1107,10 @@ class Span(Flare):
             elif isinstance(self.query[0], Or):
                 d.update(self.query[0]())
             else:
-                d['type'] = 'span'
-                d.update(self.query[0]())
+                q = self.query[0]()
+                if 'expr' not in q:
+                    d['type'] = 'span'
+                d.update(q)
         else:
             d['expr'] = '&&'
             d['args'] = [q() for q in self.query]
@@ -1090,6 +1124,9 @@ class Delta(Flare):
     Delta objects represent durations of time
     """
 
+    __slots__ = ('seconds', 'minutes', 'hours', 'days', 'weeks', 'months',
+                 'years', '_timedelta')
+
     def __init__(self, seconds=0, minutes=0, hours=0,
                  days=0, weeks=0, months=0, years=0):
         """Initialize the Delta.
@@ -1114,15 +1151,20 @@ class Delta(Flare):
         self.weeks = weeks
         self.months = months
         self.years = years
-        self.timedelta = timedelta(
-            days=days + 7 * 4 * months + 365 * years,
-            seconds=seconds,
-            microseconds=0,
-            milliseconds=0,
-            minutes=minutes,
-            hours=hours,
-            weeks=weeks
-        )
+        self._timedelta = None
+
+    @property
+    def timedelta(self):
+        """The delta as a `datetime.timedelta`, computed on first use."""
+        if self._timedelta is None:
+            self._timedelta = timedelta(
+                days=self.days + 7 * 4 * self.months + 365 * self.years,
+                seconds=self.seconds,
+                minutes=self.minutes,
+                hours=self.hours,
+                weeks=self.weeks
+            )
+        return self._timedelta
 
     def __compare__(self, other):
         """A comparator of deltas.
@@ -1334,6 +1376,35 @@ def project(stream, proj):
                     raise FlareSyntaxError("%s: %s is unsupported." % (key, val.__class__))
         return {'stream': stream(), 'projection': nd}
 
+
+def projection(paths):
+    """Build a `returning` dict which only returns the given stream paths.
+
+    Each path is nested in the projection the way it is nested in events, so
+    the returned events have the same shape and column names as before.
+
+    >>> projection([s.a.b, s.c])
+    {s: {'a': {'b': V.a.b}, 'c': V.c}}
+
+    Arguments:
+        paths -- an iterable of `StreamPath` objects. Anything else is
+                 ignored.
+    """
+    returning = {}
+    for p in paths:
+        if not isinstance(p, StreamPath) or not tuple(p):
+            continue
+        attrs = tuple(p)
+        node = returning.setdefault(p._StreamPath__stream, {})
+        for name in attrs[:-1]:
+            node = node.setdefault(name, {})
+            if isinstance(node, EventPath):
+                # a parent of this path is already returned whole
+                break
+        else:
+            node[attrs[-1]] = EventPath(attrs)
+    return returning
+
 def ast_dict(query, returning=None):
     """Generate an Abstract Syntax Tree for a given query"""
     q = query()
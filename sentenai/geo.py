@@ -0,0 +1,110 @@
+import numpy as np
+
+from sentenai.exceptions import FlareSyntaxError
+from sentenai.flare import EventPath, InCircle, InPolygon, StreamPath
+
+
+# The mean radius of the earth in kilometers.
+EARTH_RADIUS = 6371.0088
+
+
+def haversine(lat, lon, lat0, lon0):
+    """Get the great circle distance in kilometers between points.
+
+    Arguments:
+        lat, lon   -- arrays of point coordinates in degrees.
+        lat0, lon0 -- the coordinates of the point to measure from.
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    lat0, lon0 = np.radians(lat0), np.radians(lon0)
+    a = np.sin((lat - lat0) / 2) ** 2 + \
+        np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def in_circle(lat, lon, circle):
+    """Test which points lie within a circle.
+
+    Arguments:
+        lat, lon -- arrays of point coordinates in degrees.
+        circle   -- an `InCircle` from `within_distance` or its AST.
+    """
+    c = circle() if isinstance(circle, InCircle) else circle
+    lat, lon = np.asarray(lat, float), np.asarray(lon, float)
+    lat0, lon0, km = c['center']['lat'], c['center']['lon'], c['radius']
+
+    # a cheap bounding box on latitude rules out most distant points
+    dlat = np.degrees(km / EARTH_RADIUS)
+    out = np.zeros(len(lat), bool)
+    idx = np.flatnonzero((lat >= lat0 - dlat) & (lat <= lat0 + dlat))
+    out[idx] = haversine(lat[idx], lon[idx], lat0, lon0) <= km
+    return out
+
+
+def in_polygon(lat, lon, poly):
+    """Test which points lie inside a polygon.
+
+    Points outside of the bounding box of the polygon are rejected up front.
+    The remaining points are tested with a crossing number test which is
+    vectorized over points, looping only over the edges of the polygon.
+    Each edge only tests the points within its band of latitude.
+
+    Arguments:
+        lat, lon -- arrays of point coordinates in degrees.
+        poly     -- an `InPolygon` from `inside_region` or its AST.
+    """
+    p = poly() if isinstance(poly, InPolygon) else poly
+    vy = np.array([v['lat'] for v in p['vertices']], float)
+    vx = np.array([v['lon'] for v in p['vertices']], float)
+    lat, lon = np.asarray(lat, float), np.asarray(lon, float)
+
+    out = np.zeros(len(lat), bool)
+    idx = np.flatnonzero(
+        (lat >= vy.min()) & (lat <= vy.max()) &
+        (lon >= vx.min()) & (lon <= vx.max()))
+    y, x = lat[idx], lon[idx]
+
+    # sorting by latitude lets each edge visit only the points in its band
+    order = np.argsort(y)
+    ys = y[order]
+    inside = np.zeros(len(idx), bool)
+    for x0, y0, x1, y1 in zip(vx, vy, np.roll(vx, -1), np.roll(vy, -1)):
+        if y0 == y1:
+            continue
+        lo, hi = np.searchsorted(ys, [min(y0, y1), max(y0, y1)])
+        band = order[lo:hi]
+        inside[band] ^= x[band] < x0 + (y[band] - y0) * (x1 - x0) / (y1 - y0)
+    out[idx] = inside
+    return out
+
+
+def inside(frame, path, region):
+    """Test which events of a frame lie inside a region.
+
+    Locations are read from the `lat` and `lon` columns below `path`, as
+    laid out by `json_normalize`.
+
+    >>> frame[inside(frame, V.location, within_distance(5, of=Point(-71, 42)))]
+
+    Arguments:
+        frame  -- a dataframe of events.
+        path   -- the location path, either an `EventPath`, a `StreamPath`
+                  or a dotted column prefix.
+        region -- an `InCircle`, an `InPolygon` or the AST of a region
+                  condition.
+
+    Returns:
+        mask -- a boolean array with one entry per event.
+    """
+    if isinstance(path, (EventPath, StreamPath)):
+        path = ".".join(path)
+    lat, lon = path + ".lat", path + ".lon"
+    if lat not in frame or lon not in frame:
+        return np.zeros(len(frame), bool)
+    lat, lon = frame[lat].values, frame[lon].values
+
+    if isinstance(region, InCircle) or (isinstance(region, dict) and 'center' in region):
+        return in_circle(lat, lon, region)
+    elif isinstance(region, InPolygon) or (isinstance(region, dict) and 'vertices' in region):
+        return in_polygon(lat, lon, region)
+    raise FlareSyntaxError("Unsupported region: {}".format(region))
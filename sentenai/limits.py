@@ -0,0 +1,154 @@
+import threading
+import time
+
+
+class AdaptiveLimit(object):
+    """An adaptive limit on the number of requests in flight.
+
+    The limit follows additive increase, multiplicative decrease: every
+    successful request raises it by `increase / limit`, about `increase`
+    per round of requests, and an overloaded request cuts it by the factor
+    `decrease`. A request is overloaded if it fails with a retryable
+    status or a connection error, or if `tolerance` is set and it took
+    longer than `tolerance` times the fastest request seen. Requests which
+    started before the last cut can't cut it again, so one burst of errors
+    only backs off once.
+
+    Share a limit between clients to govern their requests together.
+    """
+
+    def __init__(self, initial=16, minimum=1, maximum=64, increase=1.0,
+                 decrease=0.5, tolerance=None):
+        """Initialize the limit.
+
+        Arguments:
+            initial   -- the initial number of requests in flight.
+            minimum   -- the lowest the limit may go.
+            maximum   -- the highest the limit may go. Thread pools are
+                         sized to this.
+            increase  -- the growth of the limit per round of successful
+                         requests.
+            decrease  -- the factor the limit is cut by on overload.
+            tolerance -- treat requests slower than this multiple of the
+                         fastest request as overloaded. Disabled by default
+                         as slices vary widely in size.
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.inflight = 0
+        self.fastest = None
+        self.cut = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """Wait for room for a request.
+
+        Returns:
+            start -- the start time of the request, to pass to `release`.
+        """
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+            return time.time()
+
+    def release(self, start, ok):
+        """Record the outcome of a request and free its room.
+
+        Arguments:
+            start -- the start time returned by `acquire`.
+            ok    -- whether the request succeeded.
+        """
+        now = time.time()
+        with self.cond:
+            self.inflight -= 1
+            latency = now - start
+            if ok and self.tolerance and self.fastest is not None:
+                ok = latency <= self.tolerance * self.fastest
+            if ok:
+                self.fastest = latency if self.fastest is None else min(self.fastest, latency)
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            elif start >= self.cut:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self.cut = now
+            self.cond.notify_all()
+
+
+class TokenBucket(object):
+    """A token bucket which lets callers borrow against future tokens.
+
+    Taking more tokens than are available leaves the bucket in debt, and
+    the caller waits until the debt would be paid back at the fill rate.
+    Later callers queue behind the debt, so the long run rate never
+    exceeds `rate` and bursts never exceed `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        """Initialize a full bucket.
+
+        Arguments:
+            rate     -- tokens added per second.
+            capacity -- the most tokens the bucket holds.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def take(self, n):
+        """Take tokens from the bucket.
+
+        Returns:
+            wait -- the seconds to wait before using the tokens.
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter(object):
+    """A limit on the rate of requests and bytes, shareable by clients.
+
+    Every request waits for a token from the request bucket and for as
+    many tokens from the byte bucket as its body has bytes. The bytes of
+    responses are charged after they arrive, so downloads slow down the
+    requests which follow them. Attach one limiter to several clients to
+    keep their combined traffic under the server's rate limits.
+    """
+
+    def __init__(self, requests=None, bytes=None, burst=1.0):
+        """Initialize the limiter.
+
+        Arguments:
+            requests -- the most requests per second, or None.
+            bytes    -- the most bytes per second sent and received, or
+                        None.
+            burst    -- the seconds worth of tokens which may be used at
+                        once after a quiet period.
+        """
+        self.requests = TokenBucket(requests, max(1.0, requests * burst)) if requests else None
+        self.bytes = TokenBucket(bytes, bytes * burst) if bytes else None
+
+    def before(self, size=0):
+        """Wait until a request with a body of `size` bytes may be sent."""
+        wait = 0.0
+        if self.requests:
+            wait = self.requests.take(1)
+        if self.bytes:
+            # even bodiless requests wait out the debt of earlier downloads
+            wait = max(wait, self.bytes.take(size))
+        if wait:
+            time.sleep(wait)
+
+    def after(self, size):
+        """Charge the `size` bytes of a response."""
+        if self.bytes and size:
+            self.bytes.take(size)
@@ -0,0 +1,440 @@
+import numpy as np
+import pandas as pd
+
+from sentenai.exceptions import FlareSyntaxError, SentenaiException
+from sentenai.flare import Select, ast_dict
+from sentenai.geo import inside
+from sentenai.spans import OPEN, sweep
+
+try:
+    from urllib.parse import unquote
+except:
+    from urllib import unquote
+
+
+NS = {
+    'seconds': 10**9,
+    'minutes': 60 * 10**9,
+    'hours': 3600 * 10**9,
+    'days': 24 * 3600 * 10**9,
+    'weeks': 7 * 24 * 3600 * 10**9,
+    'months': 4 * 7 * 24 * 3600 * 10**9,
+    'years': 365 * 24 * 3600 * 10**9,
+}
+
+
+def evaluate(query, frames):
+    """Evaluate a Flare query locally over a set of dataframes.
+
+    Every condition is evaluated as a vectorized boolean mask over the
+    events of its stream. A condition holds from the time of an event
+    until the next event of the same stream, so masks are carried onto a
+    single timeline of all event timestamps before being combined. Spans
+    are extracted from the combined masks by run-length encoding.
+
+    Serial patterns chain each span to the first following span which
+    satisfies its `within` and `after` constraints. Spans with an
+    `exactly` duration are cut to that duration from their start. Switches
+    are matched with a `SwitchMatcher` and yield zero width spans for
+    single transitions.
+
+    Arguments:
+        query  -- a `select()` query, a Flare object or the AST
+                  dictionary produced by `ast_dict`.
+        frames -- a dictionary mapping stream names to dataframes of
+                  events, such as the ones returned by `df`. Each frame
+                  needs a `.ts` column (or a datetime index) and a column
+                  per dotted event path.
+
+    Returns:
+        spans -- a list of `{'start': datetime, 'end': datetime}`
+                 dictionaries like `Cursor.spans()`. Spans still open at
+                 the end of the data have no `end`.
+    """
+    if isinstance(query, dict):
+        tree = query
+    elif isinstance(query, Select):
+        tree = ast_dict(query)
+    else:
+        tree = query()
+
+    if 'select' in tree:
+        start, end = bounds(tree)
+        node = tree['select']
+    else:
+        start, end = None, None
+        node = tree
+
+    ctx = Context(frames, start, end)
+    starts, ends = ctx.spans(node)
+    return to_spans(starts, ends)
+
+
+def bounds(tree):
+    """Get the start and end of a select AST in epoch nanoseconds."""
+    if 'between' in tree:
+        return ns(tree['between'][0]), ns(tree['between'][1])
+    elif 'after' in tree:
+        return ns(tree['after']), None
+    elif 'before' in tree:
+        return None, ns(tree['before'])
+    return None, None
+
+
+def ns(ts):
+    """Convert a timestamp to UTC epoch nanoseconds."""
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts.value
+
+
+def timestamps(frame):
+    """Get the event timestamps of a frame as UTC epoch nanoseconds."""
+    if '.ts' in frame:
+        ts = pd.to_datetime(frame['.ts'], utc=True)
+    else:
+        ts = pd.to_datetime(frame.index, utc=True)
+    return pd.DatetimeIndex(ts).asi8
+
+
+def ordered(frame):
+    """Sort a frame of events by time.
+
+    Returns:
+        (ts, frame) -- the sorted timestamps in epoch nanoseconds and the
+                       sorted frame.
+    """
+    ts = timestamps(frame)
+    if (np.diff(ts) < 0).any():
+        order = np.argsort(ts, kind='mergesort')
+        ts, frame = ts[order], frame.iloc[order]
+    return ts, frame.reset_index(drop=True)
+
+
+def duration(d):
+    """Convert the AST of a `delta()` to nanoseconds."""
+    return sum(NS[k] * v for k, v in d.items())
+
+
+def runs(mask, t, end=OPEN):
+    """Extract runs of true values in a mask as spans.
+
+    Arguments:
+        mask -- a boolean array, where `mask[i]` holds in `[t[i], t[i+1])`.
+        t    -- a sorted array of timestamps.
+        end  -- the end of the last interval of the timeline.
+
+    Returns:
+        (starts, ends) -- arrays of span starts and ends.
+    """
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    si = np.flatnonzero(edges == 1)
+    ei = np.flatnonzero(edges == -1)
+    tt = np.append(t, end)
+    return tt[si], tt[ei]
+
+
+def to_spans(starts, ends):
+    """Convert arrays of epoch nanoseconds into a list of span dicts."""
+    out = []
+    st = pd.to_datetime(starts, utc=True).to_pydatetime()
+    closed = ends != OPEN
+    et = pd.to_datetime(np.where(closed, ends, 0), utc=True).to_pydatetime()
+    for s, e, c in zip(st, et, closed):
+        out.append({'start': s, 'end': e} if c else {'start': s})
+    return out
+
+
+class Context(object):
+    """Evaluation state for a single query over a set of frames."""
+
+    def __init__(self, frames, start=None, end=None):
+        """Build the timeline of a query.
+
+        Arguments:
+            frames -- a dictionary mapping stream names to dataframes.
+            start  -- the start of the query in epoch nanoseconds.
+            end    -- the end of the query in epoch nanoseconds.
+        """
+        self.frames = {}
+        self.streams = {}
+        for name, frame in frames.items():
+            self.frames[name] = ordered(frame)
+
+        ts = [v[0] for v in self.frames.values()]
+        if len(ts) == 1 and (np.diff(ts[0]) > 0).all():
+            t = ts[0]
+        elif ts:
+            t = np.unique(np.concatenate(ts))
+        else:
+            t = np.array([], np.int64)
+        if start is not None:
+            t = np.union1d(t[t >= start], [start])
+        if end is not None:
+            t = t[t < end]
+        self.t = t.astype(np.int64)
+        self.start = np.iinfo(np.int64).min if start is None else start
+        self.end = OPEN if end is None else end
+
+    def stream(self, spec):
+        """Get the sorted timestamps and events of a stream AST.
+
+        Filters defined on the stream are applied to its events.
+        """
+        key = repr(sorted(spec.items()))
+        if key not in self.streams:
+            name = spec['name']
+            if name in self.frames:
+                ts, frame = self.frames[name]
+            elif unquote(name) in self.frames:
+                ts, frame = self.frames[unquote(name)]
+            else:
+                ts, frame = np.array([], np.int64), pd.DataFrame()
+
+            if 'filter' in spec:
+                m = events(spec['filter'], frame)
+                ts, frame = ts[m], frame[m].reset_index(drop=True)
+            self.streams[key] = (ts, frame)
+        return self.streams[key]
+
+    def mask(self, node):
+        """Evaluate a node as a mask over the timeline if possible.
+
+        Returns None for nodes that have to be evaluated as spans.
+        """
+        if node.get('for') or node.get('type') in ('serial', 'switch'):
+            return None
+        if 'op' in node:
+            ts, frame = self.stream(node['stream'])
+            m = compare(node, frame)
+            if len(ts) == len(self.t) and np.array_equal(ts, self.t):
+                return m
+            idx = np.searchsorted(ts, self.t, 'right') - 1
+            out = np.zeros(len(self.t), bool)
+            ok = idx >= 0
+            out[ok] = m[idx[ok]]
+            return out
+        if node.get('expr') == 'true':
+            return np.ones(len(self.t), bool)
+
+        args, op = self.children(node)
+        masks = [self.mask(a) for a in args]
+        if any(m is None for m in masks):
+            return None
+        return op.reduce(masks) if masks else np.zeros(len(self.t), bool)
+
+    def children(self, node):
+        """Get the operands and boolean operator of a combining node."""
+        if node.get('type') == 'all' or node.get('expr') == '&&':
+            return node.get('conds') or node.get('args'), np.logical_and
+        elif node.get('type') == 'any' or node.get('expr') == '||':
+            return node.get('conds') or node.get('args'), np.logical_or
+        raise SentenaiException("Cannot evaluate node locally: {}".format(node))
+
+    def spans(self, node):
+        """Evaluate a node as an array of span starts and ends."""
+        m = self.mask(dict((k, v) for k, v in node.items() if k != 'for'))
+        if m is not None:
+            starts, ends = runs(m, self.t, self.end)
+        elif node.get('type') == 'serial':
+            starts, ends = self.serial(node['conds'])
+        elif node.get('type') == 'switch':
+            ts, frame = self.stream(node['stream'])
+            starts, ends, _ = SwitchMatcher(node).match(frame, ts)
+            keep = (starts >= self.start) & (ends < self.end)
+            starts, ends = starts[keep], ends[keep]
+        else:
+            args, op = self.children(node)
+            sets = [self.spans(a) for a in args]
+            starts, ends = sweep(sets, len(sets) if op is np.logical_and else 1)
+
+        if node.get('for'):
+            starts, ends = width(node['for'], starts, ends)
+        return starts, ends
+
+    def serial(self, conds):
+        """Chain the spans of a sequence of patterns."""
+        starts, ends = self.spans(conds[0])
+        for cond in conds[1:]:
+            bs, be = self.spans(cond)
+            after = duration(cond['after']) if 'after' in cond else 0
+            idx = np.searchsorted(bs, np.minimum(ends, OPEN - after) + after, 'left')
+            ok = (idx < len(bs)) & (ends != OPEN)
+            idx = np.where(ok, idx, 0)
+            if 'within' in cond and len(bs):
+                ok &= bs[idx] - ends <= duration(cond['within'])
+            starts, ends, idx = starts[ok], be[idx[ok]], idx[ok]
+            # keep the latest preceding span for each match
+            last = np.concatenate((idx[1:] != idx[:-1], [True]))
+            starts, ends = starts[last], ends[last]
+        return starts, ends
+
+
+class SwitchMatcher(object):
+    """A compiled, vectorized matcher for a bound `Switch`.
+
+    The matcher behaves like a state machine over the events of a stream.
+    A switch `e1 >> e2` fires at an event satisfying `e2` which directly
+    follows an event satisfying `e1`. Longer chains stay in a state while
+    consecutive events satisfy its condition and advance at the first event
+    satisfying the next condition. Rather than stepping through events in
+    Python, every state is resolved for all candidate matches at once with
+    per-condition masks and "next index" arrays.
+
+    >>> m = SwitchMatcher(s(event(V.x < 0) >> event(V.x > 0)))
+    >>> m(frame)
+    """
+
+    def __init__(self, switch):
+        """Compile a switch.
+
+        Arguments:
+            switch -- a `Switch` bound to a stream or its AST.
+        """
+        node = switch if isinstance(switch, dict) else None
+        if node is None:
+            if getattr(switch, '_stream', None) is None:
+                raise FlareSyntaxError("Switches must be bound to a stream")
+            node = switch()
+        if len(node['conds']) < 2:
+            raise FlareSyntaxError("Switches must contain at least two `event()`'s")
+        self.conds = node['conds']
+        self.stream = node.get('stream')
+
+    def match(self, frame, ts=None):
+        """Find every match of the switch in a frame of events.
+
+        Arguments:
+            frame -- a time ordered dataframe of the events of a stream.
+            ts    -- the event timestamps in epoch nanoseconds. Read from
+                     the frame when omitted.
+
+        Returns:
+            (starts, ends, transitions) -- the start and end of each match
+            in epoch nanoseconds, and an `(matches, len(conds) - 1)` array
+            with the timestamp of every transition of each match.
+        """
+        if ts is None:
+            ts = timestamps(frame)
+        n = len(ts)
+        masks = [events(c, frame) for c in self.conds]
+        k = len(masks) - 1
+        if n < 2:
+            empty = np.array([], np.int64)
+            return empty, empty, np.zeros((0, k), np.int64)
+
+        # the first transition is any consecutive pair of events
+        pos = np.flatnonzero(masks[0][:-1] & masks[1][1:]) + 1
+        steps = [pos]
+        for cur, nxt in zip(masks[1:-1], masks[2:]):
+            r = following(nxt)[pos + 1]
+            ok = (r < n) & (following(~cur)[pos + 1] >= r)
+            steps = [s[ok] for s in steps]
+            pos = r[ok]
+            steps.append(pos)
+
+        if not len(pos):
+            empty = np.array([], np.int64)
+            return empty, empty, np.zeros((0, k), np.int64)
+
+        # keep the latest start for matches ending on the same event
+        last = np.concatenate((pos[1:] != pos[:-1], [True]))
+        transitions = np.stack([ts[s[last]] for s in steps], axis=1)
+        return transitions[:, 0], transitions[:, -1], transitions
+
+    def __call__(self, frames):
+        """Find every match of the switch.
+
+        Arguments:
+            frames -- a dataframe of events, or a dictionary mapping stream
+                      names to dataframes like `evaluate`.
+
+        Returns:
+            spans -- a list of `{'start', 'end', 'transitions'}`
+                     dictionaries, one per match.
+        """
+        if isinstance(frames, dict):
+            ts, frame = Context(frames).stream(self.stream)
+        else:
+            ts, frame = ordered(frames)
+        starts, ends, transitions = self.match(frame, ts)
+        spans = to_spans(starts, ends)
+        for sp, tr in zip(spans, transitions):
+            sp['transitions'] = [x['start'] for x in to_spans(tr, tr)]
+        return spans
+
+
+def following(mask):
+    """Get the index of the next true value at or after every position.
+
+    The result has one more entry than the mask, and positions with no
+    following true value map to `len(mask)`.
+    """
+    n = len(mask)
+    idx = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(idx[::-1])[::-1], n)
+
+
+def events(node, frame):
+    """Evaluate a condition or conjunction of conditions per event."""
+    if node.get('type') == '&&' or node.get('expr') == '&&':
+        m = np.ones(len(frame), bool)
+        for arg in node['args']:
+            m &= events(arg, frame)
+        return m
+    return compare(node, frame)
+
+
+def width(spec, starts, ends):
+    """Apply the duration constraints of a span."""
+    if 'at-least' in spec or 'at-most' in spec:
+        d = ends - starts
+        keep = np.ones(len(starts), bool)
+        if 'at-least' in spec:
+            keep &= d >= duration(spec['at-least'])
+        if 'at-most' in spec:
+            keep &= (d <= duration(spec['at-most'])) & (ends != OPEN)
+        return starts[keep], ends[keep]
+    else:
+        w = duration(spec)
+        keep = ends - starts >= w
+        return starts[keep], starts[keep] + w
+
+
+def compare(node, frame):
+    """Evaluate a condition for every event of a frame."""
+    col = ".".join(node['path'][1:])
+    op = node['op']
+    vt = node['arg']['type']
+    val = node['arg']['val']
+
+    if vt in ('polygon', 'circle'):
+        return inside(frame, col, val)
+    elif col not in frame:
+        return np.zeros(len(frame), bool)
+
+    x = frame[col]
+    if vt == 'double' and op != 'in':
+        x = pd.to_numeric(x, errors='coerce')
+    elif vt in ('date', 'datetime'):
+        x = pd.to_datetime(x, errors='coerce', utc=True)
+        val = pd.Timestamp(ns(val), tz='UTC')
+
+    if op == '==':
+        r = x == val
+    elif op == '!=':
+        r = x != val
+    elif op == '<':
+        r = x < val
+    elif op == '<=':
+        r = x <= val
+    elif op == '>':
+        r = x > val
+    elif op == '>=':
+        r = x >= val
+    elif op == 'in':
+        r = x.isin(val)
+    else:
+        raise FlareSyntaxError("Unsupported operator: {}".format(op))
+    return np.asarray(r, dtype=bool)
@@ -0,0 +1,237 @@
+import random
+import threading
+import time
+
+import requests
+from requests.packages.urllib3.exceptions import NewConnectionError
+
+from sentenai.exceptions import SentenaiException
+from sentenai.limits import AdaptiveLimit
+
+try:
+    from urllib.parse import urlparse
+except:
+    from urlparse import urlparse
+
+
+# Responses with these status codes are retried.
+RETRY_STATUSES = frozenset([408, 429, 500, 502, 503, 504])
+
+# Requests with these methods can be repeated without changing the result.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'])
+
+# Responses to other requests are only retried with these status codes, as
+# the server turned them away before acting on them.
+UNSAFE_RETRY_STATUSES = frozenset([429, 503])
+
+
+class CircuitOpen(SentenaiException):
+    """Requests to a host are failing fast after repeated failures."""
+
+    pass
+
+
+class CircuitBreaker(object):
+    """Stop sending requests to a host which keeps failing.
+
+    After `threshold` consecutive failed attempts the circuit opens and
+    requests fail immediately with `CircuitOpen`. Once `reset` seconds have
+    passed a single trial request is let through: the circuit closes again
+    if it succeeds and stays open for another `reset` seconds if it fails.
+    """
+
+    def __init__(self, threshold=10, reset=30.0):
+        """Initialize the breaker.
+
+        Arguments:
+            threshold -- the number of consecutive failures which open the
+                         circuit.
+            reset     -- the number of seconds to wait before a trial
+                         request.
+        """
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Check whether a request may be sent."""
+        with self.lock:
+            if self.opened is None:
+                return True
+            if not self.trial and time.time() - self.opened >= self.reset:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened = time.time()
+                self.trial = False
+
+
+class RetryPolicy(object):
+    """How failed requests are retried.
+
+    Connection errors, timeouts and responses with a retryable status are
+    retried after an exponentially growing delay with full jitter: attempt
+    `n` waits a random time up to `min(max_backoff, backoff * 2 ** n)`,
+    or as long as a `Retry-After` header asks. Every host has a
+    `CircuitBreaker`, shared by all clients using the same policy.
+
+    Requests which aren't idempotent, like the `POST` creating an event,
+    may have been acted on when they time out or fail with a server
+    error, so they are only retried when the connection couldn't be made
+    or the server turned them away with one of `unsafe_statuses`.
+    """
+
+    def __init__(self, retries=5, backoff=0.1, max_backoff=30.0,
+                 statuses=RETRY_STATUSES, threshold=10, reset=30.0,
+                 unsafe_statuses=UNSAFE_RETRY_STATUSES):
+        """Initialize the policy.
+
+        Arguments:
+            retries     -- the maximum number of retries of a request.
+            backoff     -- the base delay in seconds.
+            max_backoff -- the maximum delay in seconds.
+            statuses    -- the response status codes to retry.
+            threshold   -- consecutive failures which open the circuit of
+                           a host. `None` disables circuit breaking.
+            reset       -- seconds before a trial request to an open host.
+            unsafe_statuses -- the response status codes to retry for
+                           requests which aren't idempotent.
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.unsafe_statuses = frozenset(unsafe_statuses)
+        self.threshold = threshold
+        self.reset = reset
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, url):
+        """Get the circuit breaker of the host of a url."""
+        if self.threshold is None:
+            return None
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.threshold, self.reset)
+            return self.breakers[host]
+
+    def delay(self, attempt, resp=None):
+        """Get the number of seconds to wait before a retry."""
+        if resp is not None and resp.headers.get('retry-after'):
+            try:
+                return min(float(resp.headers['retry-after']), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, url, send, method='GET'):
+        """Send a request, retrying it as needed.
+
+        Arguments:
+            url    -- the url of the request.
+            send   -- a function sending the request and returning the
+                      response.
+            method -- the HTTP method of the request.
+
+        Returns:
+            resp -- the first response without a retryable status, or the
+                    last response once retries are exhausted.
+        """
+        breaker = self.breaker(url)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        statuses = self.statuses if idempotent else self.statuses & self.unsafe_statuses
+        attempt = 0
+        while True:
+            if breaker and not breaker.allow():
+                raise CircuitOpen("Too many failed requests to {}".format(urlparse(url).netloc))
+            try:
+                resp = send()
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if breaker:
+                    breaker.failure()
+                if attempt >= self.retries or not (idempotent or unsent(err)):
+                    raise
+                wait = self.delay(attempt)
+            else:
+                if resp.status_code not in self.statuses:
+                    if breaker:
+                        breaker.success()
+                    return resp
+                if breaker:
+                    breaker.failure()
+                if attempt >= self.retries or resp.status_code not in statuses:
+                    return resp
+                wait = self.delay(attempt, resp)
+            attempt += 1
+            time.sleep(wait)
+
+
+class RetrySession(requests.Session):
+    """A requests session which retries every request with a policy.
+
+    Every attempt also waits for its turn under an optional `RateLimiter`,
+    then for room under an `AdaptiveLimit` on the number of requests in
+    flight, and reports back whether it succeeded. The bytes of every
+    response are counted in `received`.
+    """
+
+    def __init__(self, policy=None, limit=None, rate=None):
+        requests.Session.__init__(self)
+        self.policy = policy or RetryPolicy()
+        self.limit = limit or AdaptiveLimit()
+        self.rate = rate
+        self.received = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, url, *args, **kwargs):
+        def send():
+            if self.rate:
+                self.rate.before(size(kwargs.get('data')))
+            start = self.limit.acquire()
+            ok = False
+            try:
+                resp = requests.Session.request(self, method, url, *args, **kwargs)
+                ok = resp.status_code not in self.policy.statuses
+            finally:
+                self.limit.release(start, ok)
+            received = len(resp.content or b'')
+            with self.lock:
+                self.received += received
+            if self.rate:
+                self.rate.after(received)
+            return resp
+
+        return self.policy.call(url, send, method)
+
+
+def unsent(err):
+    """Check whether a failed request never reached the server."""
+    if isinstance(err, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(err.args[0], 'reason', None) if err.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def size(data):
+    """Get the size in bytes of a request body."""
+    if data is None or isinstance(data, dict):
+        return 0
+    if hasattr(data, '__len__'):
+        return len(data)
+    return 0
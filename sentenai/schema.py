@@ -0,0 +1,125 @@
+from sentenai.utils import LazyModule, PY3
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+
+# Columns of strings with at most this fraction of distinct values become
+# categoricals when their stream has no schema.
+CATEGORY_RATIO = 0.5
+
+# Columns which are never converted.
+KEEP = frozenset(['.ts', '.id'])
+
+TEXT = str if PY3 else basestring
+
+
+def field_name(field):
+    """Get the dotted column name of a field returned by `Sentenai.fields`."""
+    if isinstance(field, dict):
+        path = field.get('path', field.get('name'))
+    else:
+        path = field
+    if isinstance(path, (list, tuple)):
+        return ".".join(str(p) for p in path)
+    return str(path)
+
+
+def compact(frame, dtypes=None, downcast=False, categories=True):
+    """Convert the columns of an event frame to compact dtypes.
+
+    Columns a schema marks as `float64` are parsed as numbers up front.
+    Columns of strings marked as `category`, or with few distinct values
+    when there is no schema, become pandas categoricals. With `downcast`,
+    floats become `float32` and integers `int32` whenever their values
+    fit.
+
+    Arguments:
+        frame      -- a frame of events, as returned by `df`.
+        dtypes     -- a dictionary mapping column names to `float64` or
+                      `category`, as returned by `Sentenai.schema`.
+        downcast   -- whether to downcast numbers to 32 bits.
+        categories -- whether to convert strings to categoricals.
+    """
+    dtypes = dtypes or {}
+    out = {}
+    for c in frame.columns:
+        col = frame[c]
+        dtype = dtypes.get(c)
+        if c in KEEP:
+            pass
+        elif dtype == 'float64' and col.dtype == object:
+            col = pd.to_numeric(col, errors='coerce')
+        elif categories and col.dtype == object and repeated(col, dtype):
+            col = col.astype('category')
+        if downcast and c not in KEEP:
+            col = narrow(col)
+        out[c] = col
+    return pd.DataFrame(out, index=frame.index)
+
+
+def repeated(col, dtype=None):
+    """Check whether a column of strings is worth storing as a categorical."""
+    if dtype is not None:
+        return dtype == 'category'
+    values = col.dropna()
+    if not len(values) or not values.map(lambda v: isinstance(v, TEXT)).all():
+        return False
+    return values.nunique() <= len(values) * CATEGORY_RATIO
+
+
+def narrow(col):
+    """Downcast a numeric column to 32 bits if its values fit."""
+    kind = col.dtype.kind
+    if kind == 'f' and col.dtype.itemsize > 4:
+        big = np.abs(col).max()
+        if not big > np.finfo('float32').max:
+            return col.astype('float32')
+    elif kind in 'iu' and col.dtype.itemsize > 4 and len(col):
+        info = np.iinfo('int32')
+        if col.min() >= info.min and col.max() <= info.max:
+            return col.astype('int32')
+    return col
+
+
+def concat(frames):
+    """Concatenate frames, keeping categorical columns categorical.
+
+    Categoricals with different categories would otherwise concatenate
+    to object columns.
+    """
+    frames = list(frames)
+    for c in set(c for f in frames for c in f.columns):
+        cols = [f[c] for f in frames if c in f.columns]
+        if len(cols) > 1 and all(col.dtype.name == 'category' for col in cols):
+            union = pd.api.types.union_categoricals(cols, ignore_order=True).categories
+            frames = [f.assign(**{c: f[c].cat.set_categories(union)}) if c in f.columns else f
+                      for f in frames]
+    return pd.concat(frames)
+
+
+def savings(before, after):
+    """Report the memory saved per column by `compact`.
+
+    Arguments:
+        before -- the original frame.
+        after  -- the compacted frame.
+
+    Returns:
+        report -- a frame indexed by column with the `dtype` and `bytes`
+                  before and after, and the bytes `saved`, with a `total`
+                  row.
+    """
+    b = before.memory_usage(index=False, deep=True)
+    a = after.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'before': before.dtypes.astype(str),
+        'after': after.dtypes.astype(str),
+        'bytes_before': b,
+        'bytes_after': a,
+        'saved': b - a,
+    })
+    total = pd.DataFrame({
+        'before': [''], 'after': [''], 'bytes_before': [b.sum()],
+        'bytes_after': [a.sum()], 'saved': [b.sum() - a.sum()]}, index=['total'])
+    return pd.concat([report, total])
@@ -0,0 +1,295 @@
+from datetime import timedelta
+
+from sentenai.utils import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+
+# The start of spans which are open at the start of the data. This is also
+# the value of NaT, so missing timestamps parse to it.
+SINCE = -2**63
+
+# The end of spans which are still open at the end of the data.
+OPEN = 2**63 - 1
+
+
+class Spans(object):
+    """A compact, time ordered sequence of spans.
+
+    Span bounds are kept in parallel arrays of UTC epoch nanoseconds, with
+    `SINCE` and `OPEN` marking spans without a start or an end, and the
+    cursor of every span as an index into a table of distinct cursor
+    tokens. Indexing and iterating yields the same dictionaries the API
+    returns, with `start` and `end` parsed to datetimes.
+    """
+
+    __slots__ = ('starts', 'ends', 'cursors', 'tokens')
+
+    def __init__(self, starts=(), ends=(), cursors=None, tokens=None):
+        """Initialize the spans.
+
+        Arguments:
+            starts  -- span starts in epoch nanoseconds.
+            ends    -- span ends in epoch nanoseconds.
+            cursors -- the index of the cursor token of each span.
+            tokens  -- the table of cursor tokens.
+        """
+        self.starts = np.asarray(starts, np.int64)
+        self.ends = np.asarray(ends, np.int64)
+        if cursors is None:
+            self.cursors = np.full(len(self.starts), -1, np.int32)
+        else:
+            self.cursors = np.asarray(cursors, np.int32)
+        self.tokens = list(tokens or [])
+
+    @classmethod
+    def parse(cls, spans):
+        """Build spans from a list of span dictionaries.
+
+        Arguments:
+            spans -- dictionaries with an optional `cursor` and optional
+                     `start` and `end` datetimes or ISO8601 strings. `Spans`
+                     are returned as is.
+        """
+        if isinstance(spans, Spans):
+            return spans
+        spans = list(spans)
+        starts = stamps([sp.get('start') for sp in spans])
+        ends = stamps([sp.get('end') for sp in spans])
+        ends[ends == SINCE] = OPEN
+        codes, tokens = pd.factorize(pd.Series([sp.get('cursor') for sp in spans], dtype=object))
+        return cls(starts, ends, codes, list(tokens))
+
+    @classmethod
+    def concat(cls, parts):
+        """Join several span sequences into one, merging their token tables."""
+        parts = list(parts)
+        tokens, index, cursors = [], {}, []
+        for p in parts:
+            remap = np.array([index.setdefault(t, len(index)) for t in p.tokens] + [-1], np.int32)
+            cursors.append(remap[p.cursors])
+        tokens = sorted(index, key=index.get)
+        return cls(
+            np.concatenate([p.starts for p in parts] or [[]]),
+            np.concatenate([p.ends for p in parts] or [[]]),
+            np.concatenate(cursors or [[]]),
+            tokens)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, (slice, np.ndarray)):
+            return Spans(self.starts[i], self.ends[i], self.cursors[i], self.tokens)
+        return self._dict(self.cursors[i], self.starts[i], self.ends[i],
+                          datetimes(self.starts[i:i + 1 or None])[0],
+                          datetimes(self.ends[i:i + 1 or None])[0])
+
+    def __iter__(self):
+        for c, s, e, sdt, edt in zip(self.cursors, self.starts, self.ends,
+                                     datetimes(self.starts), datetimes(self.ends)):
+            yield self._dict(c, s, e, sdt, edt)
+
+    def __repr__(self):
+        return "Spans({})".format(len(self))
+
+    def _dict(self, cursor, start, end, start_dt, end_dt):
+        sp = {}
+        if cursor >= 0:
+            sp['cursor'] = self.tokens[cursor]
+        if start != SINCE:
+            sp['start'] = start_dt
+        if end != OPEN:
+            sp['end'] = end_dt
+        return sp
+
+    def union(self, *others):
+        """Get the time covered by any of these spans or those of others.
+
+        Overlapping and touching spans are merged, and each resulting span
+        keeps the cursor of the latest input span starting at or before it.
+
+        Arguments:
+            others -- other `Spans`, such as those of another cursor.
+        """
+        return self._combine(others, 1)
+
+    def intersection(self, *others):
+        """Get the time covered by these spans and the spans of every other.
+
+        Arguments:
+            others -- other `Spans`, such as those of another cursor.
+        """
+        return self._combine(others, len(others) + 1)
+
+    def complement(self, start=None, end=None, min_gap=None):
+        """Get the gaps between spans within the given bounds.
+
+        Each gap keeps the cursor of the span before it, or of the first
+        span for a leading gap, so its events can be sliced.
+
+        Arguments:
+            start   -- the start of the bounds. Open if not given.
+            end     -- the end of the bounds. Open if not given.
+            min_gap -- drop gaps shorter than this timedelta or `delta()`.
+        """
+        u = self.union()
+        lo = SINCE if start is None else stamps([start])[0]
+        hi = OPEN if end is None else stamps([end])[0]
+        gs = np.maximum(np.concatenate(([lo], u.ends)), lo)
+        ge = np.minimum(np.concatenate((u.starts, [hi])), hi)
+        keep = ge > gs
+        if min_gap is not None:
+            bounded = (gs != SINCE) & (ge != OPEN)
+            keep &= ~bounded | (ge - np.where(bounded, gs, 0) >= nanos(min_gap))
+        prev = np.maximum(np.arange(len(gs)) - 1, 0)
+        cursors = u.cursors[prev] if len(u) else np.full(len(gs), -1, np.int32)
+        return Spans(gs[keep], ge[keep], cursors[keep], u.tokens)
+
+    def merge(self, within):
+        """Merge spans separated by gaps shorter than `within`.
+
+        Arguments:
+            within -- a timedelta or `delta()`.
+        """
+        u = self.union()
+        if len(u) < 2:
+            return u
+        split = u.starts[1:] - u.ends[:-1] >= nanos(within)
+        first = np.concatenate(([True], split))
+        last = np.concatenate((split, [True]))
+        return Spans(u.starts[first], u.ends[last], u.cursors[first], u.tokens)
+
+    def _combine(self, others, need):
+        parts = [Spans.parse(o) for o in (self,) + tuple(others)]
+        if need > 1:
+            # the sweep counts coverage, so each set must be disjoint
+            parts = [p.union() for p in parts]
+        allsp = Spans.concat(parts)
+        starts, ends = sweep([(p.starts, p.ends) for p in parts], need)
+        order = np.argsort(allsp.starts, kind='mergesort')
+        idx = np.searchsorted(allsp.starts[order], starts, 'right') - 1
+        return Spans(starts, ends, allsp.cursors[order][np.maximum(idx, 0)], allsp.tokens)
+
+    def closed(self):
+        """Get a mask of the spans which have both a start and an end."""
+        return (self.starts != SINCE) & (self.ends != OPEN)
+
+    def durations(self):
+        """Get the durations of closed spans in nanoseconds."""
+        c = self.closed()
+        return self.ends[c] - self.starts[c]
+
+    def gaps(self):
+        """Get the time between consecutive spans in nanoseconds."""
+        prev, nxt = self.ends[:-1], self.starts[1:]
+        g = nxt - np.where(prev == OPEN, 0, prev)
+        return g[(prev != OPEN) & (nxt != SINCE) & (g >= 0)]
+
+    def stats(self, percentiles=(5, 25, 75, 95), bins=10):
+        """Get statistics of span durations and of the gaps between spans.
+
+        Arguments:
+            percentiles -- percentiles of span durations to compute.
+            bins        -- the number of bins of the histogram of durations.
+
+        Returns:
+            stats -- a dictionary of `min`, `max`, `mean` and `median`
+                     durations as timedeltas, the `count` of closed spans,
+                     `percentiles` mapping each percentile to a duration, a
+                     `histogram` of `counts` per bin between `edges`, and
+                     the same summary of the `gaps` between spans. Empty if
+                     there are no closed spans.
+        """
+        d = self.durations()
+        if not len(d):
+            return {}
+        out = summary(d)
+        out['percentiles'] = dict(zip(
+            percentiles, [td(p) for p in np.percentile(d, percentiles)]))
+        counts, edges = np.histogram(d, bins)
+        out['histogram'] = {
+            'counts': counts.tolist(),
+            'edges': [td(e) for e in edges],
+        }
+        g = self.gaps()
+        out['gaps'] = summary(g) if len(g) else {'count': 0}
+        return out
+
+
+def sweep(sets, need):
+    """Combine sets of disjoint spans with a vectorized sweep.
+
+    Arguments:
+        sets -- a list of `(starts, ends)` tuples.
+        need -- the number of sets which must cover a point of time for it
+                to be part of the result. Use `len(sets)` for an
+                intersection and `1` for a union.
+
+    Returns:
+        (starts, ends) -- the combined, sorted and disjoint spans.
+    """
+    starts = np.concatenate([s for s, _ in sets])
+    ends = np.concatenate([e for _, e in sets])
+    if not len(starts):
+        return starts, ends
+    times = np.concatenate((starts, ends))
+    steps = np.concatenate((np.ones(len(starts), np.int64), -np.ones(len(ends), np.int64)))
+    # starts sort before ends at the same time, so touching spans are joined
+    # in a union. The zero width spans this yields in an intersection are
+    # dropped below.
+    order = np.lexsort((-steps, times))
+    times, depth = times[order], np.cumsum(steps[order])
+    inside = depth >= need
+    before = np.concatenate(([False], inside[:-1]))
+    si = np.flatnonzero(inside & ~before)
+    ei = np.flatnonzero(~inside & before)
+    s, e = times[si], times[ei]
+    keep = e > s
+    return s[keep], e[keep]
+
+
+def summary(d):
+    """Summarize an array of nanosecond durations."""
+    n = len(d)
+    return {
+        'min': td(d.min()),
+        'max': td(d.max()),
+        'mean': td(d.mean()),
+        # the upper median, found in linear time
+        'median': td(np.partition(d, n // 2)[n // 2]),
+        'count': n,
+    }
+
+
+def nanos(d):
+    """Convert a timedelta or `delta()` to nanoseconds."""
+    if hasattr(d, 'timedelta'):
+        d = d.timedelta
+    if isinstance(d, timedelta):
+        return ((d.days * 86400 + d.seconds) * 10**6 + d.microseconds) * 1000
+    return int(d)
+
+
+def td(ns):
+    """Convert nanoseconds to a timedelta."""
+    return timedelta(microseconds=int(ns) // 1000)
+
+
+def stamps(values):
+    """Parse datetimes or ISO8601 strings to epoch nanoseconds.
+
+    Missing values become `SINCE`.
+    """
+    if not values:
+        return np.zeros(0, np.int64)
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).asi8.copy()
+
+
+def datetimes(ns):
+    """Convert epoch nanoseconds to UTC datetimes, with None for open bounds."""
+    ok = (ns != SINCE) & (ns != OPEN)
+    out = np.full(len(ns), None, object)
+    out[ok] = pd.to_datetime(ns[ok], utc=True).to_pydatetime()
+    return out
@@ -1,5 +1,7 @@
-import dateutil
+import dateutil.tz
+import importlib
 import sys
+import threading
 from datetime import datetime, timedelta, tzinfo
 
 # Constants
@@ -18,6 +20,54 @@ def py2str(cls):
     return cls
 
 
+class LazyModule(object):
+    """A module which is imported on first attribute access.
+
+    Heavy dependencies like pandas are only needed to build dataframes, so
+    deferring their import keeps `import sentenai` fast.
+
+    >>> pd = LazyModule('pandas')
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+class Background(threading.Thread):
+    """Run a function in a background thread.
+
+    >>> page = Background(session.get, url)
+    >>> ...
+    >>> resp = page.get()
+    """
+
+    def __init__(self, func, *args):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.func, self.args = func, args
+        self.result, self.error = None, None
+        self.start()
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        """Wait for the function and return its result or raise its error."""
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
 class UTC(tzinfo):
     """A timezone class for UTC."""
 
@@ -35,10 +85,18 @@ def iso8601(dt):
     return dt.isoformat()
 
 
+def utc(dt):
+    """Make a datetime timezone aware, assuming UTC for naive datetimes."""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=dateutil.tz.tzutc())
+    return dt
+
+
 def cts(ts):
     """Convert a time string to a datetime object."""
+    from dateutil import parser
     try:
-        dt = dateutil.parser.parse(ts)
+        dt = parser.parse(ts)
         if dt.tzinfo:
             return dt
         else:
@@ -28,7 +28,7 @@ setup(
     packages=['sentenai'],
 
     install_requires=['dateutils', 'pandas', 'pytz', 'requests', 'shapely'],
-    extras_require={},
+    extras_require={'msgpack': ['msgpack'], 'orjson': ['orjson']},
     package_data={},
     data_files=[],
     entry_points={},
@@ -1,4 +1,5 @@
 # coding=utf-8
+import json
 import pytest
 from sentenai import *
 from sentenai.flare import ast_dict
@@ -323,3 +324,60 @@ def test_switches():
         }
     }
     assert real == expected
+
+
+def test_inside_region_prefilter():
+    from shapely.geometry import Polygon
+    s = stream("S")
+    poly = Polygon([(0, 0), (2, 0), (2, 1), (0, 1)])
+    real = ast_dict(select().span(s.loc == inside_region(poly)))
+    box = real['select']['args'][:4]
+    assert real['select']['expr'] == '&&'
+    assert [(c['path'], c['op'], c['arg']['val']) for c in box] == [
+        (("event", "loc", "lat"), ">=", 0.0),
+        (("event", "loc", "lat"), "<=", 1.0),
+        (("event", "loc", "lon"), ">=", 0.0),
+        (("event", "loc", "lon"), "<=", 2.0),
+    ]
+    assert real['select']['args'][4]['arg']['type'] == 'polygon'
+
+    real = ast_dict(select().span(s.loc == inside_region(poly, prefilter=False)))
+    assert real['select']['arg']['type'] == 'polygon'
+
+
+def test_inside_region_tolerance():
+    from shapely.geometry import Point
+    s = stream("S")
+    poly = Point(0, 0).buffer(1, resolution=1000)
+    real = ast_dict(select().span(s.loc == inside_region(poly, tolerance=0.01, prefilter=False)))
+    assert len(real['select']['arg']['val']['vertices']) < 100
+
+
+def test_isin_encodes_a_sorted_unique_list():
+    import numpy as np
+    s = stream("S")
+    real = ast_dict(select().span(isin(s.device, np.array([3, 1, 2, 3]))))
+    assert real['select']['op'] == 'in'
+    assert real['select']['arg']['val'] == [1, 2, 3]
+    real = ast_dict(select().span(isin(s.device, set(np.array([2, 1])))))
+    assert json.dumps(real['select']['arg']['val']) == '[1, 2]'
+
+
+def test_between():
+    s = stream("S")
+    real = ast_dict(select().span(between(s.x, 1, 5)))
+    assert real['select']['type'] == 'all'
+    assert [c['op'] for c in real['select']['conds']] == ['>=', '<=']
+
+
+def test_projection_from_stream_paths():
+    from sentenai.flare import projection
+    s = stream("S")
+    real = ast_dict(select().span(s.x == 1), projection([s.a.b, s.a.c, s.d]))
+    assert real['projections']['explicit'] == [{
+        'stream': {'name': 'S'},
+        'projection': {
+            'a': {'b': [{'var': ('a', 'b')}], 'c': [{'var': ('a', 'c')}]},
+            'd': [{'var': ('d',)}],
+        }
+    }]
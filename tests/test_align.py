@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from sentenai.align import Resampler, aggregate, align
+from sentenai.exceptions import SentenaiException
+
+
+def frame(times, **columns):
+    data = {'.ts': pd.to_datetime(times, utc=True)}
+    data.update(columns)
+    return pd.DataFrame(data)
+
+
+def frames():
+    return {
+        'a': frame(['2017-01-01T00:00:00.5', '2017-01-01T00:00:02.2', '2017-01-01T00:00:02.7'],
+                   x=[1.0, 2.0, 3.0]),
+        'b': frame(['2017-01-01T00:00:01.1', '2017-01-01T00:00:04.0'],
+                   y=['p', 'q'], z=[10, 20]),
+    }
+
+
+def resampled(frs, freq):
+    """The previous implementation: resample each stream, then outer join."""
+    out = []
+    for k, f in frs.items():
+        f = f.set_index('.ts').resample(freq).ffill()
+        out.append(f.rename(columns={c: k + ":" + c for c in f.columns}))
+    return out[0].join(out[1:], how="outer").reset_index()
+
+
+def test_ffill_matches_resample_and_join():
+    frs = frames()
+    got = align(frs, '1s')
+    expected = resampled(frs, '1s')
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+def test_nearest_with_tolerance():
+    got = align(frames(), '1s', method='nearest', tolerance='250ms')
+    assert list(got['.ts'].dt.second) == [0, 1, 2, 3, 4]
+    assert pd.isna(got['a:x']).tolist() == [True, True, False, True, True]
+    assert got['a:x'][2] == 2.0
+    assert pd.isna(got['b:y']).tolist() == [True, False, True, True, False]
+    assert got['b:y'][1] == 'p' and got['b:y'][4] == 'q'
+
+
+def test_nearest_looks_ahead():
+    got = align(frames(), '1s', method='nearest')
+    assert got['a:x'].tolist() == [1.0, 1.0, 2.0, 3.0, 3.0]
+    assert got['b:z'].tolist() == [10, 10, 10, 20, 20]
+
+
+def test_aggregate_per_column():
+    got = aggregate(frames(), '1s', {'x': 'max', 'b:z': 'sum', 'y': 'count'})
+    assert list(got['.ts'].dt.second) == [0, 1, 2, 3, 4]
+    assert pd.isna(got['a:x']).tolist() == [False, True, False, True, True]
+    assert got['a:x'][2] == 3.0
+    assert list(got['b:y']) == [0, 1, 0, 0, 1]
+    assert got['b:z'][4] == 20
+
+
+def test_single_aggregate_applies_to_numeric_columns():
+    got = aggregate(frames(), '2s', 'mean')
+    assert got['a:x'][:2].tolist() == [1.0, 2.5] and pd.isna(got['a:x'][2])
+    assert got['b:y'][0] == 'p'
+
+
+def test_resampler_merges_buckets_split_across_pages():
+    frs = frames()
+    whole = aggregate(frs, '1s', 'mean')
+    resampler = Resampler('1s', 'mean', compact=2)
+    for i in range(3):
+        resampler.add({'a': frs['a'].iloc[i:i + 1]})
+    resampler.add({'b': frs['b']})
+    pd.testing.assert_frame_equal(resampler.frame(), whole)
+    assert resampler.bounds()['a'][1] == pd.Timestamp('2017-01-01T00:00:02Z')
+
+
+def test_unknown_aggregate():
+    with pytest.raises(SentenaiException):
+        Resampler('1s', {'x': 'median'})
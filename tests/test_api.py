@@ -1,8 +1,14 @@
 from hypothesis import given, example, assume
 from hypothesis.strategies import text, tuples, uuids, one_of, none, integers, floats, datetimes
 
-from sentenai import Sentenai, stream
-import string, unittest, requests_mock, requests, pytest
+from sentenai import Sentenai, stream, select, delta, isin
+from sentenai.api import chunk_ast, union, plan_fetches, shard_bounds, stitch
+from sentenai.exceptions import SentenaiException
+from sentenai.limits import AdaptiveLimit
+from sentenai.retry import RetryPolicy
+from sentenai.utils import cts
+from datetime import datetime, timedelta
+import gzip, io, json, re, string, unittest, requests_mock, requests, pytest
 
 try:
     from urllib.parse import quote
@@ -19,6 +25,37 @@ URL_EVENTS_ID = URL + "streams/{}/events/{}"
 
 test_client = Sentenai(auth_key = "")
 
+
+def events(*rows):
+    """The body of a page of `(second, event)` rows of the stream `foo`."""
+    return {'streams': {'foo': 'foo'}, 'events': [
+        {'stream': 'foo', 'id': str(i), 'ts': '2017-01-01T00:00:0{}Z'.format(i), 'event': e}
+        for i, e in rows]}
+
+
+def page(rows, cursor=None):
+    """A mocked response with a page of events, continued at `cursor`."""
+    r = {'json': events(*rows)}
+    if cursor:
+        r['headers'] = {'cursor': cursor}
+    return r
+
+
+def mock_query(m, spans, pages=None):
+    """Mock a query `q` returning `spans`, given as `(cursor, start[, end])`.
+
+    The events of every span are answered with `pages`, a page body or a
+    list of responses.
+    """
+    m.post(URL + "query", headers={'location': 'q'})
+    m.get(URL + "query/q/spans", json={'spans': [
+        dict(zip(('cursor', 'start', 'end'), sp)) for sp in spans]})
+    if isinstance(pages, list):
+        m.get(re.compile(URL + r"query/q\+.*/events"), pages)
+    elif pages is not None:
+        m.get(re.compile(URL + r"query/q\+.*/events"), json=pages)
+
+
 def test_streams_call():
     with requests_mock.mock() as m:
         m.get(URL_STREAMS, json=[])
@@ -56,3 +93,402 @@ def test_delete_with_eid(eid):
         assume(test_client.delete(s, eid) == None)
 
 
+def test_shard_bounds_are_contiguous():
+    bounds = shard_bounds(datetime(2017, 1, 1), datetime(2017, 1, 5), 4)
+    assert len(bounds) == 4
+    assert bounds[0][0] == cts("2017-01-01T00:00:00Z")
+    assert bounds[-1][1] == cts("2017-01-05T00:00:00Z")
+    for (_, e), (s, _) in zip(bounds, bounds[1:]):
+        assert e == s
+
+
+def test_stitch_merges_spans_across_boundaries():
+    b = cts("2017-01-02T00:00:00Z")
+    left = [
+        {'cursor': 'a', 'start': cts("2017-01-01T01:00:00Z"), 'end': cts("2017-01-01T02:00:00Z")},
+        {'cursor': 'a', 'start': cts("2017-01-01T23:00:00Z"), 'end': b},
+    ]
+    right = [
+        {'cursor': 'b', 'start': b, 'end': cts("2017-01-02T01:00:00Z")},
+        {'cursor': 'b', 'start': cts("2017-01-02T03:00:00Z"), 'end': cts("2017-01-02T04:00:00Z")},
+    ]
+    spans = stitch([(b, left), (cts("2017-01-03T00:00:00Z"), right)])
+    assert len(spans) == 3
+    assert spans[1] == {'cursor': 'a', 'start': cts("2017-01-01T23:00:00Z"), 'end': cts("2017-01-02T01:00:00Z")}
+
+
+def test_sharded_query():
+    s = stream("foo")
+    q = select(datetime(2017, 1, 1), datetime(2017, 1, 3)).span(s.x == 1)
+
+    def post(request, context):
+        between = request.json()['between']
+        context.headers['location'] = between[0][:10]
+        return ''
+
+    spans = {
+        '2017-01-01': [{'cursor': 'c1', 'start': '2017-01-01T12:00:00Z', 'end': '2017-01-02T00:00:00Z'}],
+        '2017-01-02': [{'cursor': 'c2', 'start': '2017-01-02T00:00:00Z', 'end': '2017-01-02T06:00:00Z'}],
+    }
+
+    with requests_mock.mock() as m:
+        m.post(URL + "query", text=post)
+        for qid, sps in spans.items():
+            m.get(URL + "query/{}/spans".format(qid), json={'spans': sps})
+        cursor = test_client.query(q, shards=2)
+        assert cursor.spans() == [
+            {'start': cts('2017-01-01T12:00:00Z'), 'end': cts('2017-01-02T06:00:00Z')}
+        ]
+
+
+def test_sharded_query_refuses_sequences_and_durations():
+    s = stream("foo")
+    q = lambda: select(datetime(2017, 1, 1), datetime(2017, 1, 3))
+    with requests_mock.mock() as m:
+        for pattern in [q().span(s.x == 1).then(s.y == 2),
+                        q().span(s.x == 1, max=delta(hours=1)),
+                        q().span(s.x == 1, exactly=delta(hours=1))]:
+            with pytest.raises(SentenaiException):
+                test_client.query(pattern, shards=2)
+        assert not m.called
+
+
+def test_chunk_ast_splits_largest_list():
+    s = stream("foo")
+    tree = select().span(isin(s.device, range(25)), s.kind == ["a", "b"])()
+    chunks = chunk_ast(tree, 10)
+    assert len(chunks) == 3
+    assert [len(c['select']['args'][0]['arg']['val']) for c in chunks] == [10, 10, 5]
+    assert all(c['select']['args'][1]['arg']['val'] == ["a", "b"] for c in chunks)
+    assert len(tree['select']['args'][0]['arg']['val']) == 25
+
+
+def test_chunk_ast_keeps_sequences_whole():
+    s = stream("foo")
+    tree = select().span(isin(s.device, range(25))).then(s.x == 1)()
+    assert chunk_ast(tree, 10) == [tree]
+
+
+def test_union():
+    spans = [
+        {'start': cts("2017-01-01T02:00:00Z"), 'end': cts("2017-01-01T03:00:00Z")},
+        {'start': cts("2017-01-01T00:00:00Z"), 'end': cts("2017-01-01T01:00:00Z")},
+        {'start': cts("2017-01-01T01:00:00Z"), 'end': cts("2017-01-01T01:30:00Z")},
+    ]
+    assert union(spans) == [
+        {'start': cts("2017-01-01T00:00:00Z"), 'end': cts("2017-01-01T01:30:00Z")},
+        {'start': cts("2017-01-01T02:00:00Z"), 'end': cts("2017-01-01T03:00:00Z")},
+    ]
+
+
+def test_chunked_query():
+    s = stream("foo")
+    q = select().span(isin(s.device, range(15)))
+
+    def post(request, context):
+        context.headers['location'] = str(request.json()['select']['arg']['val'][0])
+        return ''
+
+    with requests_mock.mock() as m:
+        m.post(URL + "query", text=post)
+        m.get(URL + "query/0/spans", json={'spans': [
+            {'cursor': 'a', 'start': '2017-01-01T00:00:00Z', 'end': '2017-01-01T01:00:00Z'}]})
+        m.get(URL + "query/10/spans", json={'spans': [
+            {'cursor': 'b', 'start': '2017-01-01T00:30:00Z', 'end': '2017-01-01T02:00:00Z'}]})
+        cursor = test_client.query(q, chunk_size=10)
+        assert cursor.spans() == [
+            {'start': cts('2017-01-01T00:00:00Z'), 'end': cts('2017-01-01T02:00:00Z')}
+        ]
+
+
+def test_chunked_projections_do_not_leak_into_chunks():
+    s = stream("foo")
+    q = select().span(isin(s.device, range(15)))
+    posted = []
+
+    def post(request, context):
+        posted.append(request.json())
+        context.headers['location'] = str(len(posted))
+        return ''
+
+    with requests_mock.mock() as m:
+        m.post(URL + "query", text=post)
+        m.get(re.compile(URL + r"query/\d+/spans"), json={'spans': []})
+        cursor = test_client.query(q, chunk_size=10)
+        cursor.projected([s.a])
+        cursor.projected([s.b])
+
+    assert all('projections' not in c for c in cursor._chunks)
+    assert ['projections' in p for p in posted] == [False, False, True, True, True, True]
+    assert all('"b"' in json.dumps(p['projections']) and '"a"' not in json.dumps(p['projections'])
+               for p in posted[4:])
+
+
+def test_msgpack_codec_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    client = Sentenai(auth_key="", codec="msgpack", compress=True)
+    s = stream("foo")
+
+    def post(request, context):
+        assert request.headers['content-type'] == 'application/msgpack'
+        assert request.headers['content-encoding'] == 'gzip'
+        tree = msgpack.unpackb(gzip.decompress(request.body), raw=False)
+        assert tree['select']['path'] == ['event', 'x']
+        context.headers['location'] = 'q'
+        return b''
+
+    with requests_mock.mock() as m:
+        m.post(URL + "query", content=post)
+        m.get(URL + "query/q/spans",
+              content=msgpack.packb({'spans': [{'cursor': 'c', 'start': '2017-01-01T00:00:00Z'}]}),
+              headers={'content-type': 'application/msgpack'})
+        cursor = client.query(select().span(s.x == 1))
+        assert cursor.spans() == [{'start': cts('2017-01-01T00:00:00Z')}]
+
+
+def test_range_decodes_json_lines():
+    s = stream("foo")
+    url = "/".join([URL + "streams", "foo", "start", "2017-01-01T00:00:00+00:00", "end", "2017-01-02T00:00:00+00:00"])
+    with requests_mock.mock() as m:
+        m.get(url, text='{"a": 1}\n{"a": 2}\n')
+        assert test_client.range(s, datetime(2017, 1, 1), datetime(2017, 1, 2)) == [{'a': 1}, {'a': 2}]
+
+
+def test_query_limit_stops_paging():
+    s = stream("foo")
+
+    def spans(n, cursor=None):
+        r = {'spans': [{'cursor': 'c', 'start': '2017-01-0{}T00:00:00Z'.format(n)}]}
+        if cursor:
+            r['cursor'] = cursor
+        return r
+
+    with requests_mock.mock() as m:
+        m.post(URL + "query", headers={'location': 'q'})
+        m.get(URL + "query/q/spans", json=spans(1, 'p2'))
+        m.get(URL + "query/p2/spans", json=spans(2, 'p3'))
+        m.get(URL + "query/p3/spans", json=spans(3))
+        cursor = test_client.query(select().span(s.x == 1), limit=1, offset=1)
+        assert cursor.spans() == [{'start': cts('2017-01-02T00:00:00Z')}]
+        assert [r.url.split('/')[-2] for r in m.request_history[1:]] == ['q', 'p2']
+        assert m.request_history[-1].qs == {'limit': ['1']}
+
+
+def test_dataframe_columns_push_down_projection():
+    s = stream("foo")
+
+    with requests_mock.mock() as m:
+        m.post(URL + "query", [{'headers': {'location': 'q'}},
+                               {'headers': {'location': 'p'}}])
+        m.get(URL + "query/p/spans", json={'spans': [
+            {'cursor': 'p', 'start': '2017-01-01T00:00:00Z', 'end': '2017-01-02T00:00:00Z'}]})
+        m.get(re.compile(URL + r"query/p\+.*/events"), json=events((0, {'a': {'b': 1}})))
+        cursor = test_client.query(select().span(s.x == 1))
+        data = cursor.dataset().dataframe(s.a.b)
+
+        projected = json.loads(m.request_history[1].text)
+        assert projected['projections']['explicit'] == [
+            {'stream': {'name': 'foo'}, 'projection': {'a': {'b': [{'var': ['a', 'b']}]}}}]
+        assert list(data.columns) == ['foo:a.b']
+        assert not any('query/q/' in r.url for r in m.request_history)
+
+
+def test_inverse_dataset_slices_gaps_within_query_bounds():
+    s = stream("foo")
+    q = select(start=datetime(2017, 1, 1), end=datetime(2017, 1, 2)).span(s.x == 1)
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+a', '2017-01-01T01:00:00Z', '2017-01-01T02:00:00Z'),
+                       ('q+b', '2017-01-01T03:00:00Z', '2017-01-01T04:00:00Z')], events())
+        frames = list(test_client.query(q).dataset().inverse().dataframes())
+        windows = [r.url.split('/')[-2] for r in m.request_history[2:]]
+        assert len(frames) == 3
+        assert sorted(windows) == [
+            "q+2017-01-01T00:00:00Z+2017-01-01T01:00:00Z",
+            "q+2017-01-01T02:00:00Z+2017-01-01T03:00:00Z",
+            "q+2017-01-01T04:00:00Z+2017-01-02T00:00:00Z",
+        ]
+
+
+def test_inverse_without_spans_yields_nothing():
+    s = stream("foo")
+    q = select(start=datetime(2017, 1, 1), end=datetime(2017, 1, 2)).span(s.x == 1)
+
+    with requests_mock.mock() as m:
+        mock_query(m, [])
+        cursor = test_client.query(q)
+        assert list(cursor.dataset().inverse().dataframes()) == []
+        windows = cursor.sliding(timedelta(hours=1), timedelta(0), timedelta(hours=1), '1h')
+        assert list(windows.inverse().dataframes()) == []
+
+
+def test_checkpointed_query_resumes(tmpdir):
+    s = stream("foo")
+    path = str(tmpdir.join("query.ckpt"))
+    body = events((0, {'x': 1}))
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+a', '2017-01-01T00:00:00Z', '2017-01-01T01:00:00Z'),
+                       ('q+b', '2017-01-01T02:00:00Z', '2017-01-01T03:00:00Z')])
+        m.get(re.compile(URL + r"query/q\+2017-01-01T00.*/events"), json=body)
+        m.get(re.compile(URL + r"query/q\+2017-01-01T02.*/events"), status_code=500)
+        with pytest.raises(Exception):
+            client = Sentenai(retry=RetryPolicy(retries=0))
+            client.query(select().span(s.x == 1), checkpoint=path).dataset().dataframe()
+
+    with requests_mock.mock() as m:
+        m.get(re.compile(URL + r"query/q\+2017-01-01T02.*/events"), json=body)
+        data = test_client.query(select().span(s.x == 1), checkpoint=path).dataset().dataframe()
+        assert len(data) == 2
+        assert len(m.request_history) == 1
+
+
+def test_to_json_streams_spans():
+    s = stream("foo")
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+a', '2017-01-01T00:00:00Z', '2017-01-01T01:00:00Z'),
+                       ('q+b', '2017-01-01T02:00:00Z')], events((0, {'x': 1})))
+        cursor = test_client.query(select().span(s.x == 1))
+
+        out = io.StringIO()
+        assert cursor.to_json(out) == 2
+        lines = [json.loads(l) for l in out.getvalue().splitlines()]
+        assert [l['start'][:19] for l in lines] == ['2017-01-01T00:00:00', '2017-01-01T02:00:00']
+        assert lines[0]['streams'] == [{'stream': 'foo', 'events': [
+            {'id': '0', 'ts': '2017-01-01T00:00:00Z', 'event': {'x': 1}}]}]
+
+        out = io.BytesIO()
+        cursor.to_json(out, format="json", indent=2)
+        assert json.loads(out.getvalue().decode('utf-8'))[1]['start'][:19] == '2017-01-01T02:00:00'
+        assert len(json.loads(cursor.json())) == 2
+
+
+def test_to_json_fetches_a_bounded_window_of_slices():
+    s = stream("foo")
+    client = Sentenai(concurrency=AdaptiveLimit(initial=2, maximum=2))
+
+    fetched = []
+
+    class Writer(object):
+        def write(self, text):
+            fetched.append(len([r for r in m.request_history if r.url.endswith('/events')]))
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+{}'.format(i), '2017-01-01T00:00:0{}Z'.format(i)) for i in range(6)],
+                   events((0, {'x': 1})))
+        assert client.query(select().span(s.x == 1)).to_json(Writer()) == 6
+        assert fetched[0] <= 3
+
+
+def test_streaming_aggregation_matches_whole_slices():
+    s = stream("foo")
+    rows = lambda xs: [(x, {'x': x, 'y': 'v{}'.format(x)}) for x in xs]
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+a', '2017-01-01T00:00:00Z', '2017-01-01T01:00:00Z')],
+                   [page(rows([0, 1, 2]), 'q+p2')] * 2)
+        m.get(URL + "query/q+p2/events", [page(rows([3, 5]))] * 2)
+        cursor = test_client.query(select().span(s.x == 1))
+        agg = {'x': 'mean', 'foo:y': 'count'}
+        whole = cursor.dataset(freq='2s', agg=agg).dataframe()
+        streamed = cursor.dataset(freq='2s', agg=agg, streaming=True).dataframe()
+
+    assert list(streamed['foo:x']) == [0.5, 2.5, 5.0]
+    assert list(streamed['foo:y']) == [2, 2, 1]
+    assert streamed.equals(whole)
+    with pytest.raises(Exception):
+        cursor.dataset(agg=agg)
+
+
+def test_compact_dataset_uses_cached_schema():
+    s = stream("foo")
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+a', '2017-01-01T00:00:00Z', '2017-01-01T01:00:00Z'),
+                       ('q+b', '2017-01-01T02:00:00Z', '2017-01-01T03:00:00Z')],
+                   events(*[(i, {'x': i, 'name': 'abcdefgh'[i]}) for i in range(4)]))
+        m.get(URL + "streams/foo/fields", json=['x', 'name'])
+        m.get(URL + "streams/foo/fields/x/stats", json={'mean': 1.5})
+        m.get(URL + "streams/foo/fields/name/stats", status_code=404)
+        client = Sentenai()
+        data = client.query(select().span(s.x == 1)).dataset(compact=True, downcast=True).dataframe()
+        assert data['foo:name'].dtype.name == 'category'
+        assert data['foo:x'].dtype == 'int32'
+        assert len([r for r in m.request_history if '/fields' in r.url]) == 3
+
+
+def test_schema_is_not_cached_after_errors():
+    s = stream("foo")
+    client = Sentenai(retry=RetryPolicy(retries=0))
+
+    with requests_mock.mock() as m:
+        m.get(URL + "streams/foo/fields", json=['x'])
+        m.get(URL + "streams/foo/fields/x/stats", [{'status_code': 503}, {'json': {'mean': 1.5}}])
+        assert client.schema(s) == {}
+        assert client.schema(s) == {'x': 'float64'}
+        assert client.schema(s) == {'x': 'float64'}
+        assert m.call_count == 4
+
+
+def test_dataset_decodes_pages_in_processes():
+    s = stream("foo")
+    rows = lambda xs: [(x, {'x': x, 'y': {'z': 'v{}'.format(x)}}) for x in xs]
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+a', '2017-01-01T00:00:00Z', '2017-01-01T01:00:00Z')],
+                   [page(rows([0, 1]), 'q+p2')] * 2)
+        m.get(URL + "query/q+p2/events", [page(rows([2, 3]))] * 2)
+        cursor = test_client.query(select().span(s.x == 1))
+        local = cursor.dataset().dataframe()
+        pooled = cursor.dataset(processes=2).dataframe()
+        procs = test_client._process_pool(2)
+        again = cursor.dataset(processes=2).dataframe()
+
+    assert list(pooled['foo:y.z']) == ['v0', 'v1', 'v2', 'v3']
+    assert pooled.equals(local) and again.equals(local)
+    assert test_client._process_pool(2) is procs
+
+
+def test_plan_fetches_merges_overlapping_windows():
+    t = lambda s: datetime(2017, 1, 1, 0, 0, s)
+    windows = [('q+a', t(0), t(2)), ('q+b', t(5), t(7)), ('q+c', t(1), t(3)),
+               ('q+d', t(3), t(4)), ('p+a', t(1), t(2))]
+    assert plan_fetches(windows) == [
+        ('q+a', t(0), t(4), [0, 2, 3]),
+        ('q+b', t(5), t(7), [1]),
+        ('p+a', t(1), t(2), [4]),
+    ]
+
+
+def test_overlapping_windows_are_fetched_once():
+    s = stream("foo")
+    body = events(*[(i, {'x': i}) for i in range(5)])
+
+    with requests_mock.mock() as m:
+        mock_query(m, [('q+a', '2017-01-01T00:00:00Z', '2017-01-01T00:00:02Z'),
+                       ('q+b', '2017-01-01T00:00:01Z', '2017-01-01T00:00:03Z')], body)
+        cursor = test_client.query(select().span(s.x == 1))
+        group = cursor.dataset(window=timedelta(seconds=4))
+        frames = list(group.dataframes())
+        fetched = [r.url.split('/')[-2] for r in m.request_history if r.url.endswith('/events')]
+        separate = list(cursor.dataset(window=timedelta(seconds=4), coalesce=False).dataframes())
+
+    assert fetched == ["q+2016-12-31T23:59:59Z+2017-01-01T00:00:04Z"]
+    assert [list(f['foo:x']) for f in frames] == [[0, 1, 2], [0, 1, 2, 3]]
+    assert [list(f['foo:x']) for f in separate] == [[0, 1, 2, 3, 4]] * 2
+    assert group.metrics['fetches'] == 1 and group.metrics['windows'] == 2
+    assert group.metrics['events'] == 7 and group.metrics['events_fetched'] == 5
+    assert group.metrics['bytes_saved'] == len(json.dumps(body)) * 2 // 5
+
+
+def test_checkpoint_rejects_unrecorded_slices(tmpdir):
+    s = stream("foo")
+    with requests_mock.mock() as m:
+        mock_query(m, [])
+        cursor = test_client.query(select().span(s.x == 1), checkpoint=str(tmpdir.join("q.ckpt")))
+    with pytest.raises(SentenaiException):
+        cursor.dataset(processes=2)
+    with pytest.raises(SentenaiException):
+        cursor.sliding(timedelta(seconds=1), timedelta(0), timedelta(seconds=1), '1s',
+                       agg='mean', streaming=True)
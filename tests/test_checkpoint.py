@@ -0,0 +1,25 @@
+from sentenai.checkpoint import Checkpoint, query_key
+
+
+def test_checkpoint_reloads_and_drops_torn_records(tmpdir):
+    path = str(tmpdir.join("ckpt"))
+    c = Checkpoint(path)
+    c.query_id('k', 'q')
+    c.page('k', [{'cursor': 'q+a', 'start': '2017-01-01T00:00:00Z'}], None)
+    c.slice('k', 'q+a', [{'stream': 'foo', 'events': []}])
+    with open(path, 'a') as f:
+        f.write('{"key":"k","slice":"q+b","stre')
+
+    c = Checkpoint(path)
+    state = c.state('k')
+    assert state['query_id'] == 'q'
+    assert state['pages'] == [{'spans': [{'cursor': 'q+a', 'start': '2017-01-01T00:00:00Z'}], 'cursor': None}]
+    assert c.completed('k', 'q+a') == [{'stream': 'foo', 'events': []}]
+    assert c.completed('k', 'q+b') is None
+
+    c.slice('k', 'q+b', [])
+    assert Checkpoint(path).completed('k', 'q+b') == []
+
+
+def test_query_key_ignores_key_order():
+    assert query_key({'a': 1, 'b': [1, 2]}) == query_key({'b': [1, 2], 'a': 1})
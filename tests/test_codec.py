@@ -0,0 +1,22 @@
+import pytest
+
+from datetime import datetime
+from sentenai.codec import BACKENDS, JSONCodec, codec
+from sentenai.exceptions import SentenaiException
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_json_backends_agree(backend):
+    c = pytest.importorskip(backend) and JSONCodec(backend)
+    obj = {'path': ('event', 'x'), 'ts': datetime(2017, 1, 1), 'val': 0.5, 'ok': True, 'url': 'a/b'}
+    assert c.encode(obj) == b'{"path":["event","x"],"ts":"2017-01-01T00:00:00+00:00","val":0.5,"ok":true,"url":"a/b"}'
+    assert c.decode(c.encode(obj))['path'] == ['event', 'x']
+
+
+def test_json_backend_falls_back():
+    assert JSONCodec().backend in BACKENDS
+
+
+def test_unknown_codec():
+    with pytest.raises(SentenaiException):
+        codec("xml")
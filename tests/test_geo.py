@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from shapely.geometry import Point, Polygon
+from sentenai import stream, select, within_distance, inside_region, V
+from sentenai.geo import haversine, in_circle, in_polygon, inside
+from sentenai.local import evaluate
+from sentenai.utils import cts
+
+
+square = Polygon([(-72, 41), (-70, 41), (-70, 43), (-72, 43)])
+boston = Point(-71.06, 42.36)
+
+
+def test_haversine():
+    # Boston to New York is about 306 km
+    d = haversine(np.array([40.71]), np.array([-74.01]), 42.36, -71.06)
+    assert abs(d[0] - 306) < 2
+
+
+def test_in_circle():
+    lat = np.array([42.36, 42.40, 40.71])
+    lon = np.array([-71.06, -71.06, -74.01])
+    assert list(in_circle(lat, lon, within_distance(10, of=boston))) == [True, True, False]
+
+
+def test_in_polygon_matches_shapely():
+    rng = np.random.RandomState(0)
+    lat = rng.uniform(40, 44, 1000)
+    lon = rng.uniform(-73, -69, 1000)
+    tri = Polygon([(-72, 41), (-70, 41.5), (-71, 43)])
+    expected = [tri.contains(Point(x, y)) for x, y in zip(lon, lat)]
+    assert list(in_polygon(lat, lon, inside_region(tri))) == expected
+
+
+def test_inside_frame():
+    frame = pd.DataFrame({'loc.lat': [42.0, 45.0], 'loc.lon': [-71.0, -71.0]})
+    assert list(inside(frame, V.loc, inside_region(square))) == [True, False]
+    assert list(inside(frame, "missing", inside_region(square))) == [False, False]
+
+
+def test_evaluate_region():
+    s = stream("gps")
+    frame = pd.DataFrame({
+        '.ts': [cts("2017-01-01T00:00:00Z"), cts("2017-01-01T01:00:00Z"), cts("2017-01-01T02:00:00Z")],
+        'loc.lat': [45.0, 42.0, 45.0],
+        'loc.lon': [-71.0, -71.0, -71.0],
+    })
+    q = select().span(s.loc == inside_region(square))
+    assert evaluate(q, {'gps': frame}) == [
+        {'start': cts("2017-01-01T01:00:00Z"), 'end': cts("2017-01-01T02:00:00Z")}
+    ]
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+
+HEAVY = ['pandas', 'numpy', 'pandas.io.json', 'multiprocessing.pool', 'shapely', 'dateutil.parser']
+
+
+def test_import_defers_heavy_dependencies():
+    code = "import sys, sentenai; print(','.join(m for m in {!r} if m in sys.modules))".format(HEAVY)
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.decode('utf-8').strip() == ''
+
+
+def test_lazy_modules_load_on_use():
+    from sentenai.api import pd
+    assert pd.DataFrame().empty
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import requests_mock
+
+from sentenai import Sentenai
+from sentenai.limits import AdaptiveLimit, RateLimiter, TokenBucket
+
+
+def test_limit_grows_additively_and_backs_off_once_per_burst():
+    limit = AdaptiveLimit(initial=4, maximum=8)
+    for _ in range(4):
+        limit.release(limit.acquire(), True)
+    assert 4.9 < limit.limit < 5
+
+    starts = [limit.acquire() for _ in range(4)]
+    for start in starts:
+        limit.release(start, False)
+    assert 2.4 < limit.limit < 2.5
+
+    for _ in range(1000):
+        limit.release(limit.acquire(), True)
+    assert limit.limit == 8
+
+
+def test_limit_never_drops_below_minimum():
+    limit = AdaptiveLimit(initial=2, minimum=2)
+    for _ in range(5):
+        limit.release(limit.acquire(), False)
+    assert limit.limit == 2
+
+
+def test_slow_requests_count_as_overload():
+    limit = AdaptiveLimit(initial=4, tolerance=2)
+    limit.release(limit.acquire(), True)
+    before = limit.limit
+    limit.release(limit.acquire() - 1, True)
+    assert limit.limit < before
+
+
+def test_requests_in_flight_stay_under_the_limit():
+    limit = AdaptiveLimit(initial=3, maximum=3)
+    state = {'now': 0, 'most': 0}
+    lock = threading.Lock()
+
+    def request():
+        start = limit.acquire()
+        with lock:
+            state['now'] += 1
+            state['most'] = max(state['most'], state['now'])
+        time.sleep(0.01)
+        with lock:
+            state['now'] -= 1
+        limit.release(start, True)
+
+    threads = [threading.Thread(target=request) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert state['most'] == 3
+
+
+def test_token_bucket_borrows_against_future_tokens():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.take(2) == 0
+    assert 0.29 < bucket.take(3) <= 0.3
+
+
+def test_rate_limiter_is_shared_between_clients():
+    limiter = RateLimiter(requests=50, burst=0.02)
+    clients = [Sentenai(rate_limit=limiter), Sentenai(rate_limit=limiter)]
+    with requests_mock.mock() as m:
+        m.get("https://api.sentenai.com/streams", json=[])
+        t = time.time()
+        for i in range(10):
+            clients[i % 2].streams()
+        assert time.time() - t >= 0.17
+
+
+def test_response_bytes_slow_down_later_requests():
+    limiter = RateLimiter(bytes=1000)
+    limiter.after(1100)
+    t = time.time()
+    limiter.before()
+    assert time.time() - t >= 0.09
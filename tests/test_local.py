@@ -0,0 +1,100 @@
+import pandas as pd
+
+from datetime import datetime
+from sentenai import stream, select, any_of, delta, event, V
+from sentenai.local import evaluate, sweep, SwitchMatcher
+from sentenai.utils import cts
+import numpy as np
+
+
+def frame(*rows):
+    return pd.DataFrame([{'.ts': cts(ts), 'x': x} for ts, x in rows])
+
+
+s = stream("s")
+data = {
+    's': frame(
+        ("2017-01-01T00:00:00Z", 0),
+        ("2017-01-01T01:00:00Z", 5),
+        ("2017-01-01T02:00:00Z", 6),
+        ("2017-01-01T03:00:00Z", 1),
+        ("2017-01-01T04:00:00Z", 7),
+        ("2017-01-01T04:30:00Z", 0),
+    )
+}
+
+
+def test_evaluate_condition():
+    spans = evaluate(select().span(s.x > 4), data)
+    assert spans == [
+        {'start': cts("2017-01-01T01:00:00Z"), 'end': cts("2017-01-01T03:00:00Z")},
+        {'start': cts("2017-01-01T04:00:00Z"), 'end': cts("2017-01-01T04:30:00Z")},
+    ]
+
+
+def test_evaluate_open_span():
+    spans = evaluate(select().span(s.x == 0), data)
+    assert spans[-1] == {'start': cts("2017-01-01T04:30:00Z")}
+
+
+def test_evaluate_min_width():
+    spans = evaluate(select().span(s.x > 4, min=delta(hours=1)), data)
+    assert [sp['start'] for sp in spans] == [cts("2017-01-01T01:00:00Z")]
+
+
+def test_evaluate_between():
+    q = select(datetime(2017, 1, 1, 2), datetime(2017, 1, 1, 4, 15)).span(s.x > 4)
+    assert evaluate(q, data) == [
+        {'start': cts("2017-01-01T02:00:00Z"), 'end': cts("2017-01-01T03:00:00Z")},
+        {'start': cts("2017-01-01T04:00:00Z"), 'end': cts("2017-01-01T04:15:00Z")},
+    ]
+
+
+def test_evaluate_serial():
+    q = select().span(s.x > 4).then(s.x < 4)
+    assert evaluate(q, data) == [
+        {'start': cts("2017-01-01T01:00:00Z"), 'end': cts("2017-01-01T04:00:00Z")},
+        {'start': cts("2017-01-01T04:00:00Z")},
+    ]
+
+
+def test_evaluate_any_of():
+    q = select().span(any_of(s.x == 1, s.x == 7))
+    assert evaluate(q, data) == [
+        {'start': cts("2017-01-01T03:00:00Z"), 'end': cts("2017-01-01T04:30:00Z")},
+    ]
+
+
+def test_evaluate_stream_filter():
+    f = stream("s", V.x != 6)
+    assert evaluate(select().span(f.x > 4), data) == [
+        {'start': cts("2017-01-01T01:00:00Z"), 'end': cts("2017-01-01T03:00:00Z")},
+        {'start': cts("2017-01-01T04:00:00Z"), 'end': cts("2017-01-01T04:30:00Z")},
+    ]
+
+
+def test_sweep():
+    a = (np.array([0, 10]), np.array([5, 15]))
+    b = (np.array([3, 15]), np.array([12, 20]))
+    s0, e0 = sweep([a, b], 2)
+    assert list(s0) == [3, 10] and list(e0) == [5, 12]
+    s1, e1 = sweep([a, b], 1)
+    assert list(s1) == [0] and list(e1) == [20]
+
+
+def test_switch_matcher():
+    sw = s(event(V.x < 4) >> event(V.x > 4) >> event(V.x < 4))
+    spans = SwitchMatcher(sw)(data['s'])
+    assert [(sp['start'], sp['end']) for sp in spans] == [
+        (cts("2017-01-01T01:00:00Z"), cts("2017-01-01T03:00:00Z")),
+        (cts("2017-01-01T04:00:00Z"), cts("2017-01-01T04:30:00Z")),
+    ]
+    assert len(spans[0]['transitions']) == 2
+
+
+def test_evaluate_switch():
+    sw = event(V.x > 4) >> event(V.x < 4)
+    assert evaluate(select().span(s(sw)), data) == [
+        {'start': cts("2017-01-01T03:00:00Z"), 'end': cts("2017-01-01T03:00:00Z")},
+        {'start': cts("2017-01-01T04:30:00Z"), 'end': cts("2017-01-01T04:30:00Z")},
+    ]
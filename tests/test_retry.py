@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from sentenai import Sentenai
+from sentenai.limits import AdaptiveLimit
+from sentenai.retry import CircuitOpen, RetryPolicy, RetrySession, unsent
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class FaultServer(object):
+    """A local server answering each request with the next scripted fault.
+
+    A fault is a status code, or `None` to drop the connection. Once the
+    script runs out, requests succeed with an empty JSON list.
+    """
+
+    def __init__(self):
+        server = self
+        self.script = []
+        self.hits = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits += 1
+                fault = server.script.pop(0) if server.script else 200
+                if fault is None:
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                body = json.dumps([]).encode('utf-8')
+                self.send_response(fault)
+                if fault == 429:
+                    self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    s = FaultServer()
+    yield s
+    s.close()
+
+
+def fast(**kwargs):
+    return RetryPolicy(backoff=0.001, max_backoff=0.01, **kwargs)
+
+
+def test_retries_retryable_statuses(server):
+    server.script = [503, 429, 500]
+    resp = RetrySession(fast()).get(server.url + '/streams')
+    assert resp.status_code == 200
+    assert server.hits == 4
+
+
+def test_does_not_retry_client_errors(server):
+    server.script = [404]
+    resp = RetrySession(fast()).get(server.url + '/streams')
+    assert resp.status_code == 404
+    assert server.hits == 1
+
+
+def test_returns_last_response_when_retries_run_out(server):
+    server.script = [503] * 5
+    resp = RetrySession(fast(retries=2)).get(server.url + '/streams')
+    assert resp.status_code == 503
+    assert server.hits == 3
+
+
+def test_retries_dropped_connections(server):
+    server.script = [None, None]
+    resp = RetrySession(fast()).get(server.url + '/streams')
+    assert resp.status_code == 200
+
+
+def test_dropped_connections_raise_when_retries_run_out(server):
+    server.script = [None] * 3
+    with pytest.raises(requests.ConnectionError):
+        RetrySession(fast(retries=1)).get(server.url + '/streams')
+
+
+def test_circuit_opens_and_recovers(server):
+    server.script = [503, 503]
+    session = RetrySession(fast(retries=0, threshold=2, reset=0.05))
+    for _ in range(2):
+        assert session.get(server.url + '/streams').status_code == 503
+    with pytest.raises(CircuitOpen):
+        session.get(server.url + '/streams')
+    assert server.hits == 2
+
+    time.sleep(0.06)
+    assert session.get(server.url + '/streams').status_code == 200
+    assert session.get(server.url + '/streams').status_code == 200
+
+
+def test_client_requests_are_retried(server):
+    server.script = [502, 503]
+    client = Sentenai(host=server.url, retry=fast())
+    assert client.streams() == []
+    assert server.hits == 3
+
+
+def test_throttling_lowers_concurrency(server):
+    server.script = [429]
+    limit = AdaptiveLimit(initial=8)
+    client = Sentenai(host=server.url, retry=fast(), concurrency=limit)
+    client.streams()
+    assert 4 <= limit.limit < 5
+    assert limit.inflight == 0
+
+
+def test_posts_are_only_retried_when_turned_away(server):
+    server.script = [429, 503, 500]
+    resp = RetrySession(fast()).post(server.url + '/streams/foo/events', data=b'{}')
+    assert resp.status_code == 500
+    assert server.hits == 3
+
+
+def test_posts_are_not_retried_after_dropped_connections(server):
+    server.script = [None]
+    with pytest.raises(requests.ConnectionError):
+        RetrySession(fast()).post(server.url + '/streams/foo/events', data=b'{}')
+    assert server.hits == 1
+
+
+def test_refused_connections_never_reached_the_server(server):
+    url = server.url
+    server.close()
+    with pytest.raises(requests.ConnectionError) as err:
+        requests.post(url + '/streams/foo/events', data=b'{}')
+    assert unsent(err.value)
+    assert not unsent(requests.ReadTimeout())
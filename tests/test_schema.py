@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from sentenai.schema import compact, concat, field_name, savings
+
+
+def events():
+    return pd.DataFrame({
+        '.ts': pd.to_datetime(['2017-01-01'] * 6, utc=True),
+        '.id': [str(i) for i in range(6)],
+        'state': ['on', 'off', 'on', 'on', 'off', 'on'],
+        'label': ['a', 'b', 'c', 'd', 'e', 'f'],
+        'x': np.arange(6, dtype='float64'),
+        'n': np.arange(6, dtype='int64'),
+        'v': ['1', '2.5', None, '4', '5', '6'],
+    })
+
+
+def test_repeated_strings_become_categoricals():
+    out = compact(events())
+    assert out['state'].dtype.name == 'category'
+    assert out['label'].dtype == object
+    assert out['.id'].dtype == object
+    assert out['x'].dtype == 'float64'
+
+
+def test_schema_picks_dtypes_up_front():
+    out = compact(events(), {'label': 'category', 'state': 'category', 'v': 'float64'})
+    assert out['label'].dtype.name == 'category'
+    assert out['v'].dtype == 'float64'
+    assert out['v'].isnull().tolist() == [False, False, True, False, False, False]
+
+
+def test_downcast_to_32_bits():
+    frame = events()
+    frame['huge'] = [1e300] * 6
+    frame['wide'] = [2 ** 40] * 6
+    out = compact(frame, downcast=True)
+    assert out['x'].dtype == 'float32'
+    assert out['n'].dtype == 'int32'
+    assert out['huge'].dtype == 'float64'
+    assert out['wide'].dtype == 'int64'
+
+
+def test_savings_per_column():
+    before = events()
+    report = savings(before, compact(before, downcast=True))
+    assert report.loc['x', 'saved'] == 24
+    assert report.loc['state', 'after'] == 'category'
+    assert report.loc['total', 'saved'] == report['saved'][:-1].sum()
+
+
+def test_field_names():
+    assert field_name('a.b') == 'a.b'
+    assert field_name({'path': ['a', 'b']}) == 'a.b'
+    assert field_name(['a', 'b']) == 'a.b'
+
+
+def test_concat_keeps_categoricals():
+    a = pd.DataFrame({'s': pd.Categorical(['on', 'on'])})
+    b = pd.DataFrame({'s': pd.Categorical(['off', 'on'])})
+    out = concat([a, b])
+    assert out['s'].dtype.name == 'category'
+    assert list(out['s']) == ['on', 'on', 'off', 'on']
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from sentenai.spans import Spans, OPEN
+from sentenai.utils import cts
+
+
+def spans():
+    return Spans.parse([
+        {'cursor': 'a', 'start': '2017-01-01T00:00:00Z', 'end': '2017-01-01T00:01:00Z'},
+        {'cursor': 'a', 'start': '2017-01-01T00:02:00Z', 'end': '2017-01-01T00:05:00Z'},
+        {'cursor': 'b', 'start': '2017-01-01T00:10:00Z', 'end': '2017-01-01T00:12:00Z'},
+        {'cursor': 'b', 'start': '2017-01-01T00:20:00Z'},
+    ])
+
+
+def test_parse_round_trips_span_dicts():
+    sp = spans()
+    assert len(sp) == 4
+    assert sp.tokens == ['a', 'b']
+    assert sp.ends[-1] == OPEN
+    assert sp[0] == {'cursor': 'a', 'start': cts('2017-01-01T00:00:00Z'),
+                     'end': cts('2017-01-01T00:01:00Z')}
+    assert list(sp)[-1] == {'cursor': 'b', 'start': cts('2017-01-01T00:20:00Z')}
+    assert list(sp[1:3]) == list(sp)[1:3]
+
+
+def test_concat_merges_token_tables():
+    sp = spans()
+    joined = Spans.concat([sp[2:], Spans.parse([{'cursor': 'c'}]), sp[:2]])
+    assert [s.get('cursor') for s in joined] == ['b', 'b', 'c', 'a', 'a']
+    assert joined[2] == {'cursor': 'c'}
+
+
+def test_stats():
+    st = spans().stats(percentiles=(50,), bins=2)
+    assert st['count'] == 3
+    assert st['min'] == timedelta(minutes=1)
+    assert st['max'] == timedelta(minutes=3)
+    assert st['mean'] == timedelta(minutes=2)
+    assert st['median'] == timedelta(minutes=2)
+    assert st['percentiles'] == {50: timedelta(minutes=2)}
+    assert st['histogram']['counts'] == [1, 2]
+    assert st['gaps']['count'] == 3
+    assert st['gaps']['min'] == timedelta(minutes=1)
+    assert st['gaps']['max'] == timedelta(minutes=8)
+
+
+def test_stats_without_closed_spans():
+    assert Spans.parse([{'start': '2017-01-01T00:00:00Z'}]).stats() == {}
+    assert Spans().stats() == {}
+
+
+def test_union_and_intersection():
+    a = Spans.parse([
+        {'cursor': 'a', 'start': '2017-01-01T00:00:00Z', 'end': '2017-01-01T00:10:00Z'},
+        {'cursor': 'a', 'start': '2017-01-01T00:20:00Z', 'end': '2017-01-01T00:30:00Z'}])
+    b = Spans.parse([
+        {'cursor': 'b', 'start': '2017-01-01T00:05:00Z', 'end': '2017-01-01T00:20:00Z'}])
+    assert list(a.union(b)) == [
+        {'cursor': 'a', 'start': cts('2017-01-01T00:00:00Z'), 'end': cts('2017-01-01T00:30:00Z')}]
+    assert list(a.intersection(b)) == [
+        {'cursor': 'b', 'start': cts('2017-01-01T00:05:00Z'), 'end': cts('2017-01-01T00:10:00Z')}]
+
+
+def test_complement_within_bounds():
+    gaps = spans().complement('2016-12-31T00:00:00Z', '2017-01-02T00:00:00Z')
+    assert [(g['cursor'], g['start'], g['end']) for g in gaps] == [
+        ('a', cts('2016-12-31T00:00:00Z'), cts('2017-01-01T00:00:00Z')),
+        ('a', cts('2017-01-01T00:01:00Z'), cts('2017-01-01T00:02:00Z')),
+        ('a', cts('2017-01-01T00:05:00Z'), cts('2017-01-01T00:10:00Z')),
+        ('b', cts('2017-01-01T00:12:00Z'), cts('2017-01-01T00:20:00Z')),
+    ]
+    assert list(spans().complement())[0] == {'cursor': 'a', 'end': cts('2017-01-01T00:00:00Z')}
+    assert len(spans().complement(min_gap=timedelta(minutes=2))) == 3
+
+
+def test_merge_near_adjacent_spans():
+    merged = spans().merge(timedelta(minutes=5))
+    assert [(s['start'], s.get('end')) for s in merged] == [
+        (cts('2017-01-01T00:00:00Z'), cts('2017-01-01T00:05:00Z')),
+        (cts('2017-01-01T00:10:00Z'), cts('2017-01-01T00:12:00Z')),
+        (cts('2017-01-01T00:20:00Z'), None),
+    ]